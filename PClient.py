@@ -0,0 +1,84 @@
+"""Client of the PFinal compile daemon (python PFinal.py --daemon SOCKET).
+
+It only depends on the standard library, so it starts much faster than the compiler
+itself. Each given source.c is compiled by the daemon into source.s, or into the file
+given with -o when there is a single source (- writes to stdout).
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+
+class DaemonConnection:
+    """Connection to a compile daemon, able to carry any number of requests."""
+
+    def __init__(self, socketPath):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socketPath)
+        self.stream = self.socket.makefile('rwb')
+
+    def request(self, message):
+        self.stream.write(json.dumps(message).encode() + b'\n')
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError("The compile daemon closed the connection")
+        return json.loads(line)
+
+    def compile(self, source, filename="OutputFinal.s"):
+        return self.request({'op': 'compile', 'source': source, 'filename': filename})
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def main():
+    argParser = argparse.ArgumentParser(description=__doc__)
+    argParser.add_argument('socket', help="Unix socket of the compile daemon")
+    argParser.add_argument('sources', nargs='*', help="C files to compile")
+    argParser.add_argument('-o', '--output', help="output file for a single source, - for stdout")
+    argParser.add_argument('--stats', action='store_true', help="print the request latency statistics of the daemon")
+    argParser.add_argument('--shutdown', action='store_true', help="stop the daemon")
+    args = argParser.parse_args()
+    if args.output is not None and len(args.sources) != 1:
+        argParser.error("--output needs exactly one source")
+
+    failed = 0
+    with DaemonConnection(args.socket) as daemon:
+        for sourceFilename in args.sources:
+            outputFilename = args.output or os.path.splitext(sourceFilename)[0] + ".s"
+            if outputFilename == '-':
+                fileDirective = os.path.splitext(os.path.basename(sourceFilename))[0] + ".s"
+            else:
+                fileDirective = os.path.basename(outputFilename)
+            with open(sourceFilename) as source:
+                response = daemon.compile(source.read(), fileDirective)
+            for warning in response.get('warnings', ()):
+                print("WARNING " + sourceFilename + ": " + warning, file=sys.stderr)
+            if not response['ok']:
+                failed += 1
+                print("ERROR " + sourceFilename + ": " + response['error'], file=sys.stderr)
+            elif outputFilename == '-':
+                sys.stdout.write(response['assembly'])
+            else:
+                with open(outputFilename, 'w') as output:
+                    output.write(response['assembly'])
+        if args.stats:
+            for name, value in daemon.request({'op': 'stats'})['stats'].items():
+                print("%-16s %s" % (name, round(value, 3) if isinstance(value, float) else value))
+        if args.shutdown:
+            daemon.request({'op': 'shutdown'})
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
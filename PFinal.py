@@ -1,9 +1,26 @@
 from sly import Lexer
 from sly import Parser
+import sly
+import argparse
+import array
+import collections
+import concurrent.futures
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import marshal
+import mmap
+import os
 import re
-
-global EBPoffsetTable, typeTable, counterEBP, counterString
-global local_EBPoffsetTable, local_typeTable, local_counterEBP
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+import time
 
 
 class bcolors:
@@ -18,6 +35,12 @@ class bcolors:
     UNDERLINE = '\033[4m'
 
 
+# Special actions of the CLexer high-throughput engine, token type codes are >= 0
+LEX_SKIP, LEX_LINES, LEX_LITERAL, LEX_REMAP, LEX_ILLEGAL = -1, -2, -3, -4, -5
+# Amount of memory-mapped source lexed before its pages are released
+MMAP_RELEASE_SIZE = 16 * 1024 * 1024
+
+
 class CLexer(Lexer):
     tokens = {EQUAL, LESSTHANEQUAL, GREATERTHANEQUAL, NOTEQUAL, LOGICAND, LOGICOR, ID, INTVALUE,
               INT, VOID, IF, ELSE, WHILE, RETURN, PRINTF, SCANF, STRING}
@@ -31,7 +54,7 @@ class CLexer(Lexer):
     LOGICAND = r'&&'
     LOGICOR = r'\|\|'
 
-    @_(r'".*"')
+    @_(r'"(?:[^"\\\n]|\\.)*"')
     def STRING(self, t):
         # Remove quotation marks
         t.value = t.value[1:-1]
@@ -44,9 +67,9 @@ class CLexer(Lexer):
     ignore_tabs = r'\t'
     ignore_comments = r'//.*'
 
-    @_(r'/\*(.|\n)*\*/')
+    @_(r'/\*[^*]*\*+(?:[^/*][^*]*\*+)*/')
     def ignore_commentBlock(self, t):
-        self.lineno += len([*re.finditer('\n', t.value)])
+        self.lineno += t.value.count('\n')
 
     # Reserved keywords
     ID['int'] = INT
@@ -69,60 +92,1189 @@ class CLexer(Lexer):
         print("Illegal character '%s'" % t.value[0])
         self.index += 1
 
+    # High-throughput engine
+    # The rules above and the literals are merged into a single regex that always
+    # matches and skips the blanks in front of each lexeme, so re.finditer scans the
+    # whole input in linear time with a single match per token.
+    @classmethod
+    def fastEngine(cls, binary=False):
+        if '_fastEngines' not in vars(cls):
+            cls._fastEngines = {}
+        if binary not in cls._fastEngines:
+            typeNames = sorted(cls.tokens) + sorted(cls.literals)
+            typeCodes = {name: code for code, name in enumerate(typeNames)}
+            literalClass = '[' + ''.join(re.escape(lit) for lit in sorted(cls.literals)) + ']'
+            # An illegal character is reported once, even when it takes several bytes in UTF-8
+            illegal = r'[\xc2-\xf4][\x80-\xbf]{1,3}|.' if binary else '.'
+            pattern = r'[ \t]*(?:' + cls._master_re.pattern + '|(?P<literal>' + literalClass + ')|(?P<illegal>' + \
+                illegal + '))'
+            # The binary engine scans bytes-like sources such as memory-mapped files
+            engineRe = re.compile(pattern.encode('ascii') if binary else pattern, cls.reflags)
+
+            # Action of every named group, indexed by the group number given by Match.lastindex
+            actions = [None] * (engineRe.groups + 1)
+            for name, group in engineRe.groupindex.items():
+                if name in ('newline', 'commentBlock'):
+                    actions[group] = LEX_LINES
+                elif name in cls._ignored_tokens:
+                    actions[group] = LEX_SKIP
+                elif name == 'literal':
+                    actions[group] = LEX_LITERAL
+                elif name == 'illegal':
+                    actions[group] = LEX_ILLEGAL
+                elif name in cls._remapping:
+                    actions[group] = LEX_REMAP
+                else:
+                    actions[group] = typeCodes[name]
+            cls._fastEngines[binary] = (engineRe, actions, typeNames, typeCodes)
+        return cls._fastEngines[binary]
+
+    @classmethod
+    def typeName(cls, code):
+        return cls.fastEngine()[2][code]
+
+    def illegal(self, m, lineno):
+        tok = sly.lex.Token()
+        tok.type, tok.lineno, tok.index = 'ERROR', lineno, m.start('illegal')
+        tok.value = m.group('illegal')
+        if not isinstance(tok.value, str):
+            tok.value = tok.value.decode(errors='replace')
+        self.index = tok.index
+        self.error(tok)
+
+    def tokenizeFast(self, text, lineno=1, index=0):
+        """Same token stream as tokenize, produced by the high-throughput engine.
+
+        text may also be a bytes-like object, such as a memory-mapped file, in which case
+        offsets are byte offsets and the token values are decoded one by one.
+        """
+        binary = not isinstance(text, str)
+        engineRe, actions, typeNames, _ = self.fastEngine(binary)
+        newline = b'\n' if binary else '\n'
+        remapping = self._remapping
+        tokenFuncs = self._token_funcs
+        groupNames = {group: name for name, group in engineRe.groupindex.items()}
+        Token = sly.lex.Token
+        for m in engineRe.finditer(text, index):
+            group = m.lastindex
+            action = actions[group]
+            if action == LEX_LINES:
+                lineno += m.group(group).count(newline)
+                continue
+            elif action == LEX_SKIP:
+                continue
+            elif action == LEX_ILLEGAL:
+                self.illegal(m, lineno)
+                continue
+            value = m.group(group)
+            if binary:
+                value = value.decode()
+            if action >= 0:
+                tokType = typeNames[action]
+            elif action == LEX_LITERAL:
+                tokType = value
+            else:
+                tokType = groupNames[group]
+                tokType = remapping[tokType].get(value, tokType)
+            tok = Token()
+            tok.type = tokType
+            tok.value = value
+            tok.lineno = lineno
+            tok.index = m.start(group)
+            tok.end = m.end()
+            if tokType in tokenFuncs:
+                tok = tokenFuncs[tokType](self, tok)
+            yield tok
+        self.lineno = lineno
+
+    def tokenizeFile(self, filename, lineno=1):
+        """Tokenizes a source file through a read-only memory map instead of reading it.
+
+        The pages already lexed are released every MMAP_RELEASE_SIZE bytes, so the mapped
+        source does not accumulate in the resident set while it is parsed.
+        """
+        with open(filename, 'rb') as source:
+            if os.fstat(source.fileno()).st_size == 0:
+                return
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as text:
+                tokens = self.tokenizeFast(text, lineno)
+                canRelease = hasattr(text, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+                released = 0
+                try:
+                    for tok in tokens:
+                        if canRelease and tok.index - released >= MMAP_RELEASE_SIZE:
+                            releaseEnd = tok.index - tok.index % mmap.PAGESIZE
+                            text.madvise(mmap.MADV_DONTNEED, released, releaseEnd - released)
+                            released = releaseEnd
+                        yield tok
+                finally:
+                    # The engine holds a view of the map, which must be freed before closing it
+                    tokens.close()
+
+    def tokenizeCompact(self, text, lineno=1, index=0):
+        """Tokenizes the whole text into a TokenArrays instead of one object per lexeme."""
+        engineRe, actions, _, typeCodes = self.fastEngine()
+        remapping = self._remapping
+        groupNames = {group: name for name, group in engineRe.groupindex.items()}
+        tokens = TokenArrays(text, self)
+        types, offsets, lines = tokens.types.append, tokens.offsets.append, tokens.lines.append
+        for m in engineRe.finditer(text, index):
+            group = m.lastindex
+            action = actions[group]
+            if action >= 0:
+                types(action)
+            elif action == LEX_LITERAL:
+                types(typeCodes[m.group(group)])
+            elif action == LEX_REMAP:
+                name = groupNames[group]
+                types(typeCodes[remapping[name].get(m.group(group), name)])
+            elif action == LEX_LINES:
+                lineno += m.group(group).count('\n')
+                continue
+            elif action == LEX_ILLEGAL:
+                self.illegal(m, lineno)
+                continue
+            else:
+                continue
+            offsets(m.start(group))
+            lines(lineno)
+        self.lineno = lineno
+        return tokens
+
+    def makeToken(self, text, code, offset, lineno):
+        """Rebuilds the sly Token of a lexeme stored in a TokenArrays."""
+        tok = sly.lex.Token()
+        tok.type = self.typeName(code)
+        tok.index = offset
+        tok.lineno = lineno
+        if tok.type in self.literals:
+            tok.value = tok.type
+            tok.end = offset + 1
+        else:
+            m = self._master_re.match(text, offset)
+            tok.value = m.group()
+            tok.end = m.end()
+            if tok.type in self._token_funcs:
+                tok = self._token_funcs[tok.type](self, tok)
+        return tok
+
+
+class TokenArrays:
+    """Compact token stream: parallel arrays of type codes, offsets and line numbers.
+
+    Iterating over it rebuilds the sly tokens on demand, so it can be given to the parser.
+    """
+
+    def __init__(self, text, lexer=None):
+        self.text = text
+        self.lexer = lexer if lexer is not None else CLexer()
+        self.types = array.array('B')
+        self.offsets = array.array('q')
+        self.lines = array.array('l')
+
+    def __len__(self):
+        return len(self.types)
+
+    def __iter__(self):
+        makeToken = self.lexer.makeToken
+        text = self.text
+        for code, offset, line in zip(self.types, self.offsets, self.lines):
+            yield makeToken(text, code, offset, line)
+
+
+class CompilerOptions:
+    """Switches of the optional compilation passes, all of them enabled by default."""
+
+    def __init__(self, peephole=True, deadCode=True, prune=True, licm=True, inlineSize=30, tailCalls=True):
+        self.peephole = peephole
+        self.deadCode = deadCode
+        self.prune = prune
+        self.licm = licm
+        self.tailCalls = tailCalls
+        # Largest number of nodes of an inlined function, 0 turns inlining off
+        self.inlineSize = inlineSize
+
+    def signature(self):
+        return repr(sorted(vars(self).items()))
+
+
+class CompilationContext:
+    """Whole state of a single compilation: symbol tables, counters, strings and emitter.
+
+    Nodes and parser actions reach the context of the compilation running in their
+    thread through currentContext(), which is set while the context is entered, so
+    several compilations can run at the same time on different threads.
+    """
+
+    def __init__(self, emitter, functionCache=None, options=None):
+        self.emitter = emitter
+        self.functionCache = functionCache
+        self.options = options if options is not None else CompilerOptions()
+        # Counters of the optimization passes, printed by the --report option
+        self.stats = collections.Counter()
+        self.attachOptimizers(emitter)
+        # Registers of the function being generated, and the most any function needs
+        self.registers = RegisterAllocator(0, self.stats)
+        self.registerPressure = 0
+        # Bytes taken by the locals declared in the function being folded
+        self.frameSize = 0
+        # Locals declared so far in the function being folded, with the strides of its arrays, the
+        # variables whose address it takes, and the strides of the global arrays
+        self.localNames = None
+        self.addressTaken = None
+        self.globalArrays = {}
+        self.functionCapture = None
+        self.capturedFunctions = []
+        self.EBPoffsetTable = {}
+        self.typeTable = {}
+        # Bytes reserved for every global, and the words of the globals with an initializer
+        self.sizeTable = {}
+        self.globalValues = {}
+        # Globals the pruning pass found no reached code mentions
+        self.prunedGlobals = set()
+        self.local_EBPoffsetTable = None
+        self.local_typeTable = None
+        self.counterEBP = -4
+        self.local_counterEBP = -4
+        self.counterString = 0
+        self.strings = []
+        self.functions = {}
+        self.syntaxErrors = []
+        self.warnings = []
+        self.previous = None
+
+    def attachOptimizers(self, emitter):
+        """Sends the instructions of the emitter through the enabled optimization passes."""
+        if self.options.peephole:
+            emitter.peephole = PeepholeOptimizer(emitter.writeText, self.stats)
+        if self.options.deadCode:
+            emitter.deadCode = DeadCodeEliminator(emitter.optimizedInstruction, emitter.optimizedLabel, self.stats)
+
+    @contextlib.contextmanager
+    def discardedCode(self):
+        """Generates code that is checked, and captured for the cache, but left out of the output."""
+        emitter, stats = self.emitter, self.stats
+        labels, strings = self.counterString, len(self.strings)
+        self.emitter = MemoryEmitter(emitter.filename)
+        self.stats = collections.Counter()
+        self.attachOptimizers(self.emitter)
+        try:
+            yield
+        finally:
+            self.emitter, self.stats = emitter, stats
+            self.counterString = labels
+            del self.strings[strings:]
+
+    def raiseSyntaxErrors(self):
+        if self.syntaxErrors:
+            raise RuntimeError("Compilation failed with " + str(len(self.syntaxErrors)) + " syntax error(s):\n" +
+                               "\n".join(self.syntaxErrors))
+
+    def compile(self, parser, tokens):
+        """Parses the tokens into an AST, then walks it to generate the code into the emitter."""
+        with self:
+            program = parser.parse(self.planFunctions(tokens))
+            self.raiseSyntaxErrors()
+            if program is None:
+                raise RuntimeError("Compilation failed, no assembly was generated")
+            if self.options.inlineSize:
+                program.inline()
+            program = program.fold()
+            if self.options.prune:
+                program.prune()
+            program.generate()
+        self.storeFunctions()
+
+    def planFunctions(self, tokens):
+        """Token stream to parse, with the function definitions found in the cache spliced."""
+        if self.functionCache is None:
+            return tokens
+        return iter(self.functionCache.plan(list(tokens), self.options.signature(), self.options.inlineSize > 0))
+
+    def beginFunction(self, key, references=(), inlinable=False):
+        """Starts capturing the code of a function definition whose "{" token value is key.
+
+        references are the names the function mentions, kept in its cache entry for the
+        call graph of the programs that take it from the cache, along with inlinable.
+        """
+        # Dead code elimination and peephole rewrites never cross the boundaries of a function
+        self.emitter.beginFunction()
+        if self.functionCapture is not None:
+            # A definition nested in another one, the enclosing definition is not cached
+            self.functionCapture.key = None
+            self.functionCapture.depth += 1
+        elif isinstance(key, FunctionKey):
+            self.functionCapture = FunctionCapture(key, self.counterString, len(self.strings), references,
+                                                   inlinable)
+            self.emitter.startCapture()
+
+    def endFunction(self):
+        self.emitter.endFunction()
+        capture = self.functionCapture
+        if capture is None:
+            return
+        if capture.depth > 0:
+            capture.depth -= 1
+            return
+        self.functionCapture = None
+        text = self.emitter.stopCapture()
+        if capture.key is not None:
+            entry = FunctionCache.makeEntry(text, capture.labelBase, self.counterString - capture.labelBase,
+                                            capture.stringBase, self.strings[capture.stringBase:],
+                                            capture.references, capture.inlinable)
+            if entry is not None:
+                self.capturedFunctions.append((capture.key, entry))
+
+    def spliceFunction(self, cached):
+        """Emits a cached function definition, renumbering its labels and strings."""
+        # Its code was already optimized when it was cached
+        self.emitter.beginFunction()
+        text = cached.expand(self.counterString, len(self.strings))
+        self.emitter.noteStrings(text)
+        self.emitter.writeText(text)
+        self.emitter.endFunction()
+        self.counterString += cached.labels
+        self.strings.extend(cached.strings)
+
+    def storeFunctions(self):
+        """Stores the function definitions compiled without errors in the cache."""
+        if self.functionCache is not None and self.capturedFunctions:
+            for key, entry in self.capturedFunctions:
+                self.functionCache.store(key, entry)
+            self.functionCache.evict()
+        self.capturedFunctions.clear()
+
+    def __enter__(self):
+        self.previous = getattr(activeContext, 'context', None)
+        activeContext.context = self
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        activeContext.context = self.previous
+        self.previous = None
+
+
+activeContext = threading.local()
+
+
+def currentContext():
+    try:
+        return activeContext.context
+    except AttributeError:
+        raise RuntimeError("No compilation is running in this thread") from None
+
 
 def newLabelID():
-    global counterString
-    counterString += 1
-    return counterString
+    ctx = currentContext()
+    ctx.counterString += 1
+    return ctx.counterString
+
+
+class Emitter:
+    """Collects the generated assembly in memory and writes it with a single bulk write.
+
+    Instructions and labels go to the text section, while the file header, string
+    literals and global variables go to the data section, which is placed first.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = []
+        self.text = []
+        self.capture = None
+        self.deadCode = None
+        self.peephole = None
+        # Numbers of the string literals the code refers to
+        self.referencedStrings = set()
+
+    @staticmethod
+    def formatInstruction(line, comment=None):
+        if comment is None:
+            return "\t" + line + "\n"
+        return "\t" + line + " #" + comment + "\n"
+
+    def writeText(self, line):
+        self.text.append(line)
+        if self.capture is not None:
+            self.capture.append(line)
+
+    def writeData(self, line):
+        self.data.append(line)
+
+    def startCapture(self):
+        """Starts keeping a copy of the text written from now on, see stopCapture."""
+        self.drain()
+        self.capture = []
+
+    def stopCapture(self):
+        """Returns the text written since startCapture."""
+        self.drain()
+        captured = ''.join(self.capture)
+        self.capture = None
+        return captured
+
+    def instruction(self, line, comment=None):
+        if self.deadCode is not None:
+            self.deadCode.instruction(line, comment)
+        else:
+            self.optimizedInstruction(line, comment)
+
+    def label(self, label):
+        if self.deadCode is not None:
+            self.deadCode.label(label)
+        else:
+            self.optimizedLabel(label)
+
+    def optimizedInstruction(self, line, comment=None):
+        """Instruction left by the dead code elimination, for the peephole optimizer."""
+        self.noteStrings(line)
+        if self.peephole is not None:
+            self.peephole.instruction(line, comment)
+        else:
+            self.writeText(self.formatInstruction(line, comment))
+
+    def optimizedLabel(self, label):
+        if self.peephole is not None:
+            self.peephole.label(label)
+        else:
+            self.writeText(label + ':\n')
+
+    def noteStrings(self, text):
+        """Records the string literals some code refers to."""
+        if '$.s' in text:
+            self.referencedStrings.update(int(number) for number in FunctionCache.stringRe.findall(text))
+
+    def beginFunction(self):
+        self.drain()
+        if self.deadCode is not None:
+            self.deadCode.beginFunction()
+
+    def endFunction(self):
+        if self.deadCode is not None:
+            self.deadCode.endFunction()
+        self.drain()
+
+    def drain(self):
+        """Writes the instructions still held by the peephole optimizer."""
+        if self.peephole is not None:
+            self.peephole.drain()
+
+    def dataInstruction(self, line, comment=None):
+        self.writeData(self.formatInstruction(line, comment))
+
+    def dataLabel(self, label):
+        self.writeData(label + ':\n')
+
+    def globalVar(self, var, tam, wsize, values=()):
+        self.dataInstruction(".align " + str(wsize))
+        self.dataLabel(var)
+        for start in range(0, len(values), 8):
+            self.dataInstruction(".long " + ", ".join(values[start:start + 8]))
+        if tam > 4 * len(values):
+            self.dataInstruction(".zero " + str(tam - 4 * len(values)))
+
+    def flush(self):
+        self.drain()
+        with open(self.filename, 'w') as output:
+            output.write(''.join(self.data) + ''.join(self.text))
+        self.data.clear()
+        self.text.clear()
+
+
+class MemoryEmitter(Emitter):
+    """Emitter that keeps the flushed assembly in the output attribute instead of a file."""
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.output = None
+
+    def flush(self):
+        self.drain()
+        self.output = ''.join(self.data) + ''.join(self.text)
+        self.data.clear()
+        self.text.clear()
+
+
+class SpoolEmitter(Emitter):
+    """Emitter for very large outputs that keeps memory use flat.
+
+    Each section is spooled to its own temporary file next to the output as code is
+    generated. On flush both spools are joined into the output file with a kernel side
+    copy, so the generated code is never read back into Python.
+    """
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        spoolDir = os.path.dirname(os.path.abspath(filename))
+        self.data = tempfile.TemporaryFile('w+', dir=spoolDir)
+        self.text = tempfile.TemporaryFile('w+', dir=spoolDir)
+
+    def writeText(self, line):
+        self.text.write(line)
+        if self.capture is not None:
+            self.capture.append(line)
+
+    def writeData(self, line):
+        self.data.write(line)
+
+    @staticmethod
+    def copySpool(spool, output):
+        spool.flush()
+        spoolFd = spool.fileno()
+        outFd = output.fileno()
+        remaining = os.fstat(spoolFd).st_size
+        offset = 0
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(spoolFd, outFd, remaining, offset)
+                if copied == 0:
+                    break
+                offset += copied
+                remaining -= copied
+        except (AttributeError, OSError):
+            # copy_file_range is not available for these files, use sendfile instead
+            while remaining > 0:
+                copied = os.sendfile(outFd, spoolFd, offset, remaining)
+                if copied == 0:
+                    break
+                offset += copied
+                remaining -= copied
+
+    def flush(self):
+        self.drain()
+        with open(self.filename, 'wb') as output:
+            self.copySpool(self.data, output)
+            self.copySpool(self.text, output)
+        self.data.close()
+        self.text.close()
+
+
+class PeepholeOptimizer:
+    """Rewrites the instructions written to an emitter through a sliding window.
+
+    Instructions and labels are held in a window of the latest entries. Every time one
+    is added, the rules of the table are tried on the end of the window until none
+    applies, and the entries leaving the window are written to the sink. The number of
+    times each rule applied is counted in stats.
+    """
+
+    windowSize = 8
+
+    def __init__(self, sink, stats):
+        self.sink = sink
+        self.stats = stats
+        # Entries are (op, operands, comment), with op None for labels
+        self.window = []
+        # Rule table: name, number of entries matched at the end of the window, rule. A rule
+        # returns the entries replacing the matched ones, or None when it does not apply
+        self.rules = (
+            ('push-pop-same', 2, self.pushPopSame),
+            ('push-pop-move', 2, self.pushPopMove),
+            ('self-move', 1, self.selfMove),
+            ('dead-load', 2, self.deadLoad),
+            ('jump-next-label', 2, self.jumpNextLabel),
+        )
+
+    @staticmethod
+    def isRegister(operand):
+        return operand.startswith('%')
+
+    @staticmethod
+    def isMemory(operand):
+        return not operand.startswith(('%', '$'))
+
+    def pushPopSame(self, push, pop):
+        if push[0] == 'pushl' and pop[0] == 'popl' and push[1] == pop[1]:
+            return []
+
+    def pushPopMove(self, push, pop):
+        if push[0] == 'pushl' and pop[0] == 'popl' and not (self.isMemory(push[1][0]) and self.isMemory(pop[1][0])):
+            return [('movl', (push[1][0], pop[1][0]), pop[2] or push[2])]
+
+    def selfMove(self, move):
+        if move[0] == 'movl' and move[1][0] == move[1][1]:
+            return []
+
+    def deadLoad(self, first, second):
+        # The register loaded by the first move is overwritten by the second one without being read
+        if first[0] == 'movl' and second[0] == 'movl' and self.isRegister(first[1][1]) and \
+                first[1][1] == second[1][1] and first[1][1] not in second[1][0]:
+            return [second]
+
+    def jumpNextLabel(self, jump, label):
+        if jump[0] is not None and jump[0].startswith('j') and label[0] is None and jump[1] == label[1]:
+            return [label]
+
+    def instruction(self, line, comment=None):
+        op, _, operands = line.partition(' ')
+        self.push((op, tuple(operands.split(', ')) if operands else (), comment))
+        self.stats['peephole instructions in'] += 1
+
+    def label(self, label):
+        self.push((None, (label,), None))
+
+    def push(self, entry):
+        window = self.window
+        window.append(entry)
+        applied = True
+        while applied:
+            applied = False
+            for name, size, rule in self.rules:
+                if len(window) >= size:
+                    replacement = rule(*window[-size:])
+                    if replacement is not None:
+                        window[-size:] = replacement
+                        self.stats['peephole ' + name] += 1
+                        applied = True
+                        break
+        if len(window) > self.windowSize:
+            self.write(window.pop(0))
+
+    def write(self, entry):
+        op, operands, comment = entry
+        if op is None:
+            self.sink(operands[0] + ':\n')
+        else:
+            self.stats['peephole instructions out'] += 1
+            self.sink(Emitter.formatInstruction(op + ' ' + ', '.join(operands) if operands else op, comment))
+
+    def drain(self):
+        for entry in self.window:
+            self.write(entry)
+        self.window.clear()
+
+
+class DeadCodeEliminator:
+    """Removes the dead code of every function before it reaches the peephole optimizer.
+
+    The instructions of a function are held until it ends, then split into basic blocks
+    linked by a control flow graph. Blocks not reachable from the entry are removed, then
+    stores to locals never read, and last, with a liveness analysis of the registers and
+    flags over the graph, the instructions whose results are never used. The number of
+    instructions removed for each reason is counted in stats.
+    """
+
+    registers = ('%eax', '%ebx', '%ecx', '%edx', '%esi', '%edi', '%esp', '%ebp')
+    everything = frozenset(registers + ('flags',))
+    registerRe = re.compile(r'%([a-d])l\b|%[a-z]+')
+    frameSlotRe = re.compile(r'-?[0-9]+\(%ebp\)$')
+    # Instructions that overwrite their destination without reading it, and do not set the flags
+    moves = ('movl', 'movzbl', 'leal')
+    arithmetic = ('addl', 'subl', 'andl', 'imull', 'shll', 'sarl', 'shrl', 'negl', 'xchgl')
+
+    def __init__(self, instructionSink, labelSink, stats):
+        self.instructionSink = instructionSink
+        self.labelSink = labelSink
+        self.stats = stats
+        # Entries are (op, operands, comment), with op None for labels
+        self.entries = []
+        self.depth = 0
+        self.effectCache = {}
+        # A definition nested in another one is emitted in the middle of its code, which is
+        # then passed through untouched as the jumps may cross the nested definition
+        self.nested = False
+
+    def beginFunction(self):
+        if self.depth > 0 and not self.nested:
+            self.nested = True
+            self.write(self.entries)
+            self.entries = []
+        self.depth += 1
+
+    def endFunction(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if not self.nested:
+                self.write(self.eliminate(self.entries))
+            self.entries = []
+            self.effectCache.clear()
+            self.nested = False
+
+    def instruction(self, line, comment=None):
+        if self.depth == 0 or self.nested:
+            self.instructionSink(line, comment)
+        else:
+            op, _, operands = line.partition(' ')
+            self.entries.append((op, tuple(operands.split(', ')) if operands else (), comment))
+
+    def label(self, label):
+        if self.depth == 0 or self.nested:
+            self.labelSink(label)
+        else:
+            self.entries.append((None, (label,), None))
+
+    def write(self, entries):
+        for op, operands, comment in entries:
+            if op is None:
+                self.labelSink(operands[0])
+            else:
+                self.instructionSink(op + ' ' + ', '.join(operands) if operands else op, comment)
+
+    def count(self, reason, removed):
+        self.stats['dead code ' + reason] += removed
+        self.stats['dead code instructions removed'] += removed
+
+    def eliminate(self, entries):
+        blocks = self.basicBlocks(entries)
+        successors = self.controlFlow(blocks)
+
+        # Unreachable blocks
+        reached = {0}
+        pending = [0]
+        while pending:
+            for successor in successors[pending.pop()] or ():
+                if successor not in reached:
+                    reached.add(successor)
+                    pending.append(successor)
+        self.count('unreachable', sum(1 for index, block in enumerate(blocks) if index not in reached
+                                      for entry in block if entry[0] is not None))
+        blocks = [block if index in reached else [] for index, block in enumerate(blocks)]
+
+        # Stores to locals that are never read, unless the address of a local is taken or a
+        # local is indexed
+        if not any(entry[0] == 'leal' and '%ebp' in entry[1][0] or any('(%ebp,' in operand for operand in entry[1])
+                   for block in blocks for entry in block):
+            read = {operand for block in blocks for entry in block
+                    for operand in (entry[1][:-1] if entry[0] == 'movl' else entry[1])}
+            for index, block in enumerate(blocks):
+                kept = [entry for entry in block if not (entry[0] == 'movl' and entry[1][1] not in read and
+                                                         self.frameSlotRe.match(entry[1][1]))]
+                self.count('stores', len(block) - len(kept))
+                blocks[index] = kept
+
+        # Instructions whose results are never used, until no more are found
+        removed = True
+        while removed:
+            removed = False
+            liveOut = self.liveness(blocks, successors)
+            for index, block in enumerate(blocks):
+                live = set(liveOut[index])
+                kept = []
+                for entry in reversed(block):
+                    uses, defines, sideEffect = self.effects(entry)
+                    if sideEffect or defines & live:
+                        live -= defines
+                        live |= uses
+                        kept.append(entry)
+                if len(kept) < len(block):
+                    self.count('values', len(block) - len(kept))
+                    blocks[index] = kept[::-1]
+                    removed = True
+        return [entry for block in blocks for entry in block]
+
+    @staticmethod
+    def basicBlocks(entries):
+        """Splits the entries before every label and after every jump or return."""
+        blocks = [[]]
+        for entry in entries:
+            op = entry[0]
+            if op is None and blocks[-1]:
+                blocks.append([])
+            blocks[-1].append(entry)
+            if op is not None and (op.startswith('j') or op == 'ret'):
+                blocks.append([])
+        return blocks
+
+    @staticmethod
+    def controlFlow(blocks):
+        """Successors of every block, None when they are unknown."""
+        labels = {entry[1][0]: index for index, block in enumerate(blocks) for entry in block if entry[0] is None}
+        successors = []
+        for index, block in enumerate(blocks):
+            last = block[-1][0] if block else None
+            following = [index + 1] if index + 1 < len(blocks) else None
+            if last == 'ret':
+                successors.append([])
+            elif last is not None and last.startswith('j'):
+                target = labels.get(block[-1][1][0])
+                if target is None:
+                    successors.append(None)
+                elif last == 'jmp':
+                    successors.append([target])
+                else:
+                    successors.append([target] + following if following is not None else None)
+            else:
+                successors.append(following)
+        return successors
+
+    def liveness(self, blocks, successors):
+        """Registers and flags live at the end of every block."""
+        # What every block reads before defining it, and what it defines
+        summaries = []
+        for block in blocks:
+            used, defined = set(), set()
+            for entry in reversed(block):
+                uses, defines, sideEffect = self.effects(entry)
+                used -= defines
+                used |= uses
+                defined |= defines
+            summaries.append((used, defined))
+        liveIn = [set() for _ in blocks]
+        liveOut = [set() for _ in blocks]
+        changed = True
+        while changed:
+            changed = False
+            for index in reversed(range(len(blocks))):
+                following = successors[index]
+                out = self.everything if following is None else set().union(*(liveIn[s] for s in following))
+                used, defined = summaries[index]
+                live = used | (out - defined)
+                liveOut[index] = out
+                if live != liveIn[index]:
+                    liveIn[index] = live
+                    changed = True
+        return liveOut
+
+    def registersOf(self, operand):
+        return {'%e' + match.group(1) + 'x' if match.group(1) else match.group(0)
+                for match in self.registerRe.finditer(operand)}
+
+    def effects(self, entry):
+        """Registers and flags an instruction uses and defines, and whether it has to be kept anyway."""
+        effects = self.effectCache.get(entry)
+        if effects is None:
+            effects = self.effectCache[entry] = self.instructionEffects(*entry)
+        return effects
+
+    def instructionEffects(self, op, operands, comment):
+        if op is None:
+            return set(), set(), True
+        if op.startswith('j'):
+            return ({'flags'} if op != 'jmp' else set()), set(), True
+        if op == 'call':
+            return {'%esp'}, {'%eax', '%ecx', '%edx', 'flags'}, True
+        if op == 'ret':
+            return {'%eax', '%ebx', '%esi', '%edi', '%ebp', '%esp'}, set(), True
+        if op == 'pushl':
+            return self.registersOf(operands[0]) | {'%esp'}, {'%esp'}, True
+        if op == 'popl':
+            return {'%esp'}, self.registersOf(operands[0]) | {'%esp'}, True
+        if op == 'cdq':
+            return {'%eax'}, {'%edx'}, False
+        if op == 'idivl' or op == 'imull' and len(operands) == 1:
+            return self.registersOf(operands[0]) | {'%eax', '%edx'}, {'%eax', '%edx', 'flags'}, False
+        if op.startswith('set'):
+            # Only the low byte is written, the rest of the register is kept
+            register = self.registersOf(operands[0])
+            return register | {'flags'}, register, False
+        if op == 'cmpl':
+            return self.registersOf(operands[0]) | self.registersOf(operands[1]), {'flags'}, False
+        if op not in self.moves and op not in self.arithmetic:
+            return self.everything, self.everything, True
+
+        destination = operands[-1]
+        uses = set().union(*(self.registersOf(operand) for operand in operands[:-1]))
+        defines = set() if op in self.moves else {'flags'}
+        if op == 'xchgl':
+            uses |= self.registersOf(destination)
+            defines |= uses
+        elif op in self.arithmetic and len(operands) < 3:
+            # Read, modify and write
+            uses |= self.registersOf(destination)
+        if not destination.startswith('%'):
+            # A store to memory, its address is read
+            return uses | self.registersOf(destination), defines, True
+        defines |= self.registersOf(destination)
+        return uses, defines, bool(defines & {'%esp', '%ebp'})
+
+
+class Temporary:
+    """Intermediate value of an expression, held in a register or spilled to the stack."""
+    __slots__ = ('register',)
+
+    def __init__(self, register):
+        self.register = register
+
+    def __str__(self):
+        return self.register
+
+
+class MemoryOperand:
+    """Memory operand of an indirect access, with the temporaries holding its address."""
+    __slots__ = ('text', 'temporaries')
+
+    def __init__(self, text, temporaries=()):
+        self.text = text
+        self.temporaries = list(temporaries)
+
+    def __str__(self):
+        return self.text
+
+
+def memoryAddress(base, displacement=0, index=None, scale=1):
+    """AT&T operand of base + displacement + index * scale.
+
+    base is a register, a frame slot or a symbol, and index a register or None.
+    """
+    if base.endswith('(%ebp)'):
+        displacement += int(base[:-len('(%ebp)')])
+        base = '%ebp'
+    if base.startswith('%'):
+        text = (str(displacement) if displacement else '') + '(' + base
+    else:
+        text = base + ('+' if displacement > 0 else '') + (str(displacement) if displacement else '')
+        if index is None:
+            return text
+        text += '('
+    if index is not None:
+        text += ',' + index + ',' + str(scale)
+    return text + ')'
+
+
+def isImmediate(operand):
+    return isinstance(operand, str) and operand.startswith('$')
+
+
+def isPowerOfTwo(value):
+    return value > 0 and value & (value - 1) == 0
+
+
+# Condition codes of the jcc and setcc instructions, and the ones of their negations
+conditionCodes = {'>': 'g', '>=': 'ge', '<': 'l', '<=': 'le', '==': 'e', '!=': 'ne'}
+negatedConditions = {'g': 'le', 'ge': 'l', 'l': 'ge', 'le': 'g', 'e': 'ne', 'ne': 'e'}
+byteRegisters = {'%eax': '%al', '%ebx': '%bl', '%ecx': '%cl', '%edx': '%dl'}
+
+
+def conditionValue(condition, comment=None):
+    """Temporary set to 1 when the flags meet a condition code and to 0 otherwise."""
+    registers = currentContext().registers
+    byteFree = [register for register in registers.registers
+                if register in byteRegisters and register not in registers.owners]
+    result = registers.claim(byteFree[0]) if byteFree else registers.allocate()
+    if result.register in byteRegisters:
+        Node.Write("set" + condition + " " + byteRegisters[result.register], comment)
+        Node.Write("movzbl " + byteRegisters[result.register] + ", " + result.register)
+        return result
+    # %esi and %edi have no byte register, branch instead
+    label = "condTrue" + str(newLabelID())
+    Node.Write("movl $1, " + result.register, comment)
+    Node.Write("j" + condition + " " + label)
+    Node.Write("movl $0, " + result.register)
+    Node.WriteLabel(label)
+    return result
+
+
+def registerNeed(first, second, least=1):
+    """Sethi-Ullman number of a node whose operands need first and second registers.
+
+    The highest number of the function being folded is kept in the context, as it
+    decides how many callee saved registers the function uses.
+    """
+    need = max(first + 1 if first == second else max(first, second), least)
+    ctx = currentContext()
+    if need > ctx.registerPressure:
+        ctx.registerPressure = need
+    return need
+
+
+def divisionMagic(divisor):
+    """Multiplier and shift that divide by a constant divisor > 2 that is not a power of two.
+
+    The quotient of n is the high word of multiplier * n shifted right, plus one when n
+    is negative. The shift is the smallest one whose multiplier is exact for every 32 bit n.
+    """
+    for shift in range(32):
+        power = 1 << (32 + shift)
+        multiplier = -(-power // divisor)
+        if multiplier * divisor - power < 1 << (shift + 1):
+            return multiplier, shift
+    raise RuntimeError("Internal error: no magic number for " + str(divisor))
+
+
+def multiplyByConstant(register, constant, comment=None):
+    """Multiplies a register by a constant with shifts and leal when they are cheaper than imull."""
+    constant = wrapInt32(constant)
+    magnitude = abs(constant)
+    shift = (magnitude & -magnitude).bit_length() - 1 if magnitude else 0
+    odd = magnitude >> shift
+    # Odd factors made of at most two leal, which multiply by 3, 5 or 9
+    factors = next(([first] + ([second] if second != 1 else []) for first in (3, 5, 9) for second in (1, 3, 5, 9)
+                    if first * second == odd), None)
+    if constant == 0:
+        Node.Write("movl $0, " + register, comment)
+    elif odd != 1 and factors is None:
+        Node.Write("imull $" + str(constant) + ", " + register, comment)
+        return
+    for factor in factors or ():
+        Node.Write("leal (" + register + "," + register + "," + str(factor - 1) + "), " + register, comment)
+    if shift:
+        Node.Write("shll $" + str(shift) + ", " + register, comment)
+    if constant < 0:
+        Node.Write("negl " + register, comment)
+    currentContext().stats['strength reduced *'] += 1
+
+
+class RegisterAllocator:
+    """Registers of the expression temporaries of the function being generated.
+
+    Operands are evaluated in Sethi-Ullman order, so temporaries are released in the
+    reverse order of their allocation. The caller saved registers are always used, and
+    as many callee saved registers as the function needs, which its prologue saves. A
+    temporary is spilled to the stack only when the other operand needs more registers
+    than are free, and the live caller saved registers are pushed around every call.
+    """
+
+    callerSaved = ('%eax', '%ecx', '%edx')
+    calleeSaved = ('%ebx', '%esi', '%edi')
+
+    def __init__(self, count, stats):
+        self.registers = (self.callerSaved + self.calleeSaved)[:max(len(self.callerSaved), count)]
+        self.stats = stats
+        self.owners = {}
+
+    def saved(self):
+        """Callee saved registers used by the function."""
+        return self.registers[len(self.callerSaved):]
+
+    def freeCount(self):
+        return len(self.registers) - len(self.owners)
+
+    def allocate(self, avoid=()):
+        for register in self.registers:
+            if register not in self.owners and register not in avoid:
+                return self.claim(register)
+        raise RuntimeError("Internal error: no register is free")
+
+    def claim(self, register):
+        """Allocates a given free register."""
+        temporary = Temporary(register)
+        self.owners[register] = temporary
+        return temporary
+
+    def release(self, operand):
+        if isinstance(operand, Temporary) and self.owners.get(operand.register) is operand:
+            del self.owners[operand.register]
+
+    def load(self, operand, comment=None):
+        """Temporary holding the value of an operand, loaded in a register if needed."""
+        if isinstance(operand, Temporary):
+            return operand
+        temporary = self.allocate()
+        Node.Write("movl " + operand + ", " + temporary.register, comment)
+        return temporary
+
+    def move(self, temporary, register, comment=None):
+        """Moves a temporary to a free register."""
+        Node.Write("movl " + temporary.register + ", " + register, comment)
+        del self.owners[temporary.register]
+        temporary.register = register
+        self.owners[register] = temporary
+
+    def spill(self, temporary):
+        Node.Write("pushl " + temporary.register, "Spill temporary")
+        del self.owners[temporary.register]
+        temporary.register = None
+        self.stats['registers spilled'] += 1
+
+    def reload(self, temporary):
+        temporary.register = self.allocate().register
+        self.owners[temporary.register] = temporary
+        Node.Write("popl " + temporary.register, "Reload spilled temporary")
+
+    def save(self, registers):
+        """Pushes the temporaries held in some registers, which are free until restored."""
+        saved = [self.owners.pop(register) for register in registers if register in self.owners]
+        for temporary in saved:
+            Node.Write("pushl " + temporary.register, "Save " + temporary.register)
+        self.stats['registers saved'] += len(saved)
+        return saved
+
+    def restore(self, saved):
+        for temporary in reversed(saved):
+            Node.Write("popl " + temporary.register, "Restore " + temporary.register)
+            self.owners[temporary.register] = temporary
 
 
 # AST Nodes
+# The parser only builds the tree: every node keeps its children and its line number.
+# Code is generated afterwards by a walk over the whole tree, started by
+# NodeProgram.generate(), so passes over the complete program can run in between.
+# When generated, expression nodes return the operand holding their value: NodeNum an
+# immediate, NodeId its memory operand and the other nodes a Temporary. need is the
+# number of registers the evaluation of a node takes, set when it is folded.
 class Node:
-    outputFilename = ""
+    __slots__ = ()
     nodeType = None
+    need = 0
+
+    def fold(self):
+        """Evaluates the constant subexpressions, returns the node that replaces this one."""
+        return self
+
+    def generate(self):
+        pass
+
+    def branch(self, label, when):
+        """Jumps to label when the expression is true (when is True) or false, else falls through."""
+        registers = currentContext().registers
+        operand = self.generate()
+        if isImmediate(operand):
+            operand = registers.load(operand)
+        Node.Write("cmpl $0, " + str(operand), "Check the condition")
+        registers.release(operand)
+        Node.Write(("jne " if when else "je ") + label)
+
+    @staticmethod
+    def generatePair(p1, p2):
+        """Generates two operands, the one that needs more registers first.
+
+        Returns their operands in the given order. The value of the operand generated
+        first is spilled while the other one is generated if not enough registers are free.
+        """
+        registers = currentContext().registers
+        first, second = (p2, p1) if p2.need > p1.need else (p1, p2)
+        firstOperand = first.generate()
+        spilled = isinstance(firstOperand, Temporary) and registers.freeCount() < second.need
+        if spilled:
+            registers.spill(firstOperand)
+        secondOperand = second.generate()
+        if spilled:
+            registers.reload(firstOperand)
+        if first is p2:
+            return secondOperand, firstOperand
+        return firstOperand, secondOperand
 
     @staticmethod
     def Write(line, comment=None):
-        with open(Node.outputFilename, 'a') as output:
-            if comment is None:
-                output.write("\t" + line + "\n")
-            else:
-                output.write("\t" + line + " #" + comment + "\n")
+        currentContext().emitter.instruction(line, comment)
 
     @staticmethod
     def WriteLabel(label):
-        with open(Node.outputFilename, 'a') as output:
-            output.write(label + ':\n')
+        currentContext().emitter.label(label)
 
     @staticmethod
-    def WriteGlobalVar(var, tam, wsize):
-        with open(Node.outputFilename, 'a') as output:
-            output.write(".comm " + var + ", " + str(tam) + ", " + str(wsize) + '\n')
+    def WriteGlobalVar(var, tam, wsize, values=()):
+        currentContext().emitter.globalVar(var, tam, wsize, values)
 
     @staticmethod
     def WriteStrings():
-        global EBPoffsetTable
+        ctx = currentContext()
 
-        if not ("main" in typeTable.keys()):
+        if not ("main" in ctx.typeTable.keys()):
             NodeError("main function not found!")
         else:
-            with open(Node.outputFilename, 'r') as output:
-                auxiliar = output.read()
-                open(Node.outputFilename, 'w')
-
-            Node.Write('.file "' + Node.outputFilename + '"')
+            ctx.emitter.dataInstruction('.file "' + ctx.emitter.filename + '"')
             contador = 0
-            if not ("main" in typeTable.keys()):
-                NodeError("main function is missing!")
-            for string in strings:
-                Node.WriteLabel(".s" + str(contador))
-                Node.Write('.string "' + string + '"')
+            for string in ctx.strings:
+                # The strings of the code removed as dead are not written either
+                if not ctx.options.prune or contador in ctx.emitter.referencedStrings:
+                    ctx.emitter.dataLabel(".s" + str(contador))
+                    ctx.emitter.dataInstruction('.string "' + string + '"')
+                else:
+                    ctx.stats['removed strings'] += 1
                 contador += 1
-            for globalVar in EBPoffsetTable.keys():
-                Node.WriteGlobalVar(globalVar, typeTable[globalVar].size, 4)
-
-            with open(Node.outputFilename, 'a') as output:
-                output.write(auxiliar)
+            # Globals with an initializer other than zero go to .data, with their values, the rest to .bss
+            initialized = {name for name, values in ctx.globalValues.items()
+                           if any(value != '0' for value in values)}
+            for section, inData in (('.data', True), ('.bss', False)):
+                names = [name for name in ctx.EBPoffsetTable
+                         if name not in ctx.prunedGlobals and (name in initialized) == inData]
+                if names:
+                    ctx.emitter.dataInstruction(section)
+                for globalVar in names:
+                    Node.WriteGlobalVar(globalVar, ctx.sizeTable[globalVar], 4,
+                                        ctx.globalValues[globalVar] if inData else ())
+            ctx.emitter.dataInstruction('.text')
 
 class NodeError(Node):
     def __init__(self, msg, line=None):
@@ -132,33 +1284,84 @@ class NodeError(Node):
             raise RuntimeError(bcolors.BOLD + bcolors.OKGREEN + "->" + msg + bcolors.ENDC)
 
 
+class NodeWarning(Node):
+    def __init__(self, msg, line=None):
+        if line is not None:
+            msg = "Line:" + str(line) + "->" + msg
+        else:
+            msg = "->" + msg
+        # The copies of an inlined function give the warnings of the function again
+        warnings = currentContext().warnings
+        if msg in warnings:
+            return
+        print(bcolors.BOLD + bcolors.WARNING + "Warning " + msg + bcolors.ENDC)
+        warnings.append(msg)
+
+
 # AST Type Nodes
+# Types are interned in TYPES, so two types are equal only if they are the same object.
+# Use TYPES.int, TYPES.void and TYPES.pointer() instead of creating type nodes.
 class NodeInt(Node):
+    __slots__ = ('size', 'depth')
+
     def __init__(self):
         self.size = 4
+        self.depth = 0
 
 
 class NodeId(Node):
+    """Variable, strides are the bytes between the elements of every dimension of an array."""
+    __slots__ = ('idname', 'line', 'val', 'nodeType', 'strides', 'need')
+
     def __init__(self, idname, line=None):
-        global EBPoffsetTable, typeTable
         self.idname = idname
-        if local_EBPoffsetTable is not None:
-            if self.idname in local_EBPoffsetTable:
-                self.val = EBPoffsetTable[self.idname] + "(%ebp)"
-                self.nodeType = local_typeTable[self.idname]
-            elif self.idname in EBPoffsetTable:
-                self.val = "$" + self.idname
-                self.nodeType = typeTable[self.idname]
-        elif self.idname in EBPoffsetTable:
-            self.val = "$" + self.idname
-            self.nodeType = typeTable[self.idname]
+        self.line = line
+        self.val = None
+        self.nodeType = None
+        self.strides = ()
+        self.need = 0
+
+    def fold(self):
+        ctx = currentContext()
+        if ctx.localNames is not None and self.idname in ctx.localNames:
+            self.strides = ctx.localNames[self.idname]
+            # The address of a local array is computed in a register
+            self.need = 1 if self.strides else 0
         else:
-            NodeError("Symbol " + self.idname + " is not declared!", line)
+            self.strides = ctx.globalArrays.get(self.idname, ())
+        return self
+
+    def generate(self):
+        location = self.location()
+        if not self.strides:
+            return location
+        # Arrays decay to the address of their first element
+        if location.endswith('(%ebp)'):
+            address = currentContext().registers.allocate()
+            super().Write("leal " + location + ", " + address.register, "Address of " + self.idname)
+            return address
+        return "$" + location
+
+    def location(self):
+        """Memory operand of the variable, also kept in val."""
+        ctx = currentContext()
+        if ctx.local_EBPoffsetTable is not None and self.idname in ctx.local_EBPoffsetTable:
+            self.val = ctx.local_EBPoffsetTable[self.idname] + "(%ebp)"
+            self.nodeType = ctx.local_typeTable[self.idname]
+        elif self.idname in ctx.EBPoffsetTable:
+            self.val = self.idname
+            self.nodeType = ctx.typeTable[self.idname]
+        else:
+            NodeError("Symbol " + self.idname + " is not declared!", self.line)
+        return self.val
 
 
 class NodeNum(Node):
+    __slots__ = ('val', 'numVal', 'nodeType', 'line')
+
     def __init__(self, val, nodeType, line):
         self.nodeType = nodeType
+        self.line = line
         try:
             numVal = int(float(val.replace('f', '')))
             self.val = str(numVal)
@@ -166,484 +1369,1100 @@ class NodeNum(Node):
         except ValueError:
             NodeError("Error parsing number value!", line)
 
+    @classmethod
+    def fromValue(cls, value, line):
+        return cls(str(value), TYPES.int, line)
+
+    def generate(self):
+        return "$" + self.val
+
+    def branch(self, label, when):
+        # A constant condition is decided now
+        if (wrapInt32(self.numVal) != 0) == when:
+            super().Write("jmp " + label)
+
 
 class NodeArray(Node):
+    __slots__ = ('refNode', 'indxVal', 'size')
+
     def __init__(self, refNode, indxVal):
         self.refNode = refNode
         self.indxVal = indxVal
         self.size = 4
         return
 
+    def fold(self):
+        if isinstance(self.refNode, NodeArray):
+            self.refNode.fold()
+        self.indxVal = self.indxVal.fold()
+        return self
+
+    def generate(self):
+        # Dimensions are evaluated from left to right
+        if isinstance(self.refNode, NodeArray):
+            self.refNode.generate()
+        currentContext().registers.release(self.indxVal.generate())
+
 
 class NodePointer(Node):
+    __slots__ = ('refNode', 'size', 'depth', 'elementSize')
+
     def __init__(self, refNode):
         self.refNode = refNode
         self.size = refNode.size
+        self.depth = refNode.depth + 1
+        self.elementSize = refNode.size
         return
 
 
 class NodeVoid(Node):
+    __slots__ = ('size', 'depth')
+
     def __init__(self):
-        pass
+        self.size = 0
+        self.depth = 0
+
+
+class TypeTable:
+    """Interns the types, so that each distinct type exists once.
+
+    Type checks are identity checks, whatever the pointer depth. Pointer types are
+    created the first time they are asked for and shared by every compilation.
+    """
+
+    def __init__(self):
+        self.int = NodeInt()
+        self.void = NodeVoid()
+        self.pointers = {}
+
+    def pointer(self, refType):
+        try:
+            return self.pointers[refType]
+        except KeyError:
+            # setdefault keeps a single instance if several threads race here
+            return self.pointers.setdefault(refType, NodePointer(refType))
+
+
+TYPES = TypeTable()
+
+
+# Constant folding, with the semantics of 32-bit C int
+def wrapInt32(value):
+    return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+
+def foldArithmetic(op, a, b):
+    """Value of a op b, or None when it is not defined and must be left to run time."""
+    a, b = wrapInt32(a), wrapInt32(b)
+    if op == '+':
+        return wrapInt32(a + b)
+    elif op == '-':
+        return wrapInt32(a - b)
+    elif op == '*':
+        return wrapInt32(a * b)
+    if b == 0 or (a == -0x80000000 and b == -1):
+        return None
+    # Division truncates towards zero and the remainder takes the sign of the dividend
+    quotient = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        quotient = -quotient
+    if op == '/':
+        return quotient
+    elif op == '%':
+        return a - b * quotient
+    return None
+
+
+def foldRelational(op, a, b):
+    a, b = wrapInt32(a), wrapInt32(b)
+    return int({'>': a > b, '>=': a >= b, '<': a < b, '<=': a <= b, '==': a == b, '!=': a != b}[op])
+
+
+def foldInstructions(body):
+    return [instruction.fold() for instruction in body]
+
+
+def nodeSlots(node):
+    for cls in type(node).__mro__:
+        yield from getattr(cls, '__slots__', ())
+
+
+def identifiersOf(node, found=None):
+    """Names of the variables and functions mentioned in a subtree, for the call graph."""
+    if found is None:
+        found = set()
+    if isinstance(node, Node):
+        for slot in nodeSlots(node):
+            # The copy of an inlined function does not call it
+            if slot != 'name' or not isinstance(node, NodeInlineCall):
+                identifiersOf(getattr(node, slot, None), found)
+    elif isinstance(node, list):
+        for item in node:
+            identifiersOf(item, found)
+    elif isinstance(node, str) and node.isidentifier() and not isinstance(node, FunctionKey):
+        found.add(node)
+    return found
+
+
+def subtreeNeed(node):
+    """Most registers any node of a subtree needs."""
+    if isinstance(node, list):
+        return max((subtreeNeed(item) for item in node), default=0)
+    if not isinstance(node, Node):
+        return 0
+    needs = [subtreeNeed(getattr(node, slot, None)) for slot in nodeSlots(node) if slot != 'nodeType']
+    return max([node.need] + needs)
 
 
 # AST Operation Nodes
+class NodeProgram(Node):
+    __slots__ = ('body',)
+
+    def __init__(self, body):
+        self.body = body
+
+    def fold(self):
+        self.body = foldInstructions(self.body)
+        return self
+
+    def inline(self):
+        """Replaces the calls to small functions by copies of their bodies."""
+        ctx = currentContext()
+        Inliner(ctx.options.inlineSize, ctx.stats).run(self.body)
+
+    def prune(self):
+        """Leaves out of the output the functions main does not reach and the globals no reached
+        code mentions, which are still checked as in a --no-prune build.
+
+        The call graph links every function to the names it mentions, so a function or a
+        global is also kept when a reached function has a local of the same name.
+        """
+        ctx = currentContext()
+        definitions = {}
+        roots = {'main'}
+        for instruction in self.body:
+            if isinstance(instruction, NodeFunction):
+                definitions.setdefault(instruction.name, []).append(instruction.references())
+            elif isinstance(instruction, NodeFunctionDecl):
+                if instruction.cached is not None:
+                    definitions.setdefault(instruction.name, []).append(instruction.cached.references)
+            elif isinstance(instruction, NodeDeclaration):
+                for declaration in instruction.declarations:
+                    # The globals an initializer takes the address of are kept along with it
+                    if declaration.rval is not None:
+                        references = identifiersOf(declaration.rval)
+                        definitions.setdefault(declaration.declaredName(), []).append(references)
+            else:
+                identifiersOf(instruction, roots)
+
+        reached = set()
+        pending = list(roots)
+        while pending:
+            name = pending.pop()
+            if name not in reached:
+                reached.add(name)
+                for references in definitions.get(name, ()):
+                    pending.extend(references)
+
+        for instruction in self.body:
+            if isinstance(instruction, (NodeFunction, NodeFunctionDecl)) and instruction.name in definitions:
+                instruction.used = instruction.name in reached
+                isDefinition = isinstance(instruction, NodeFunction) or instruction.cached is not None
+                if isDefinition and not instruction.used:
+                    ctx.stats['removed function ' + instruction.name] += 1
+            elif isinstance(instruction, NodeDeclaration):
+                # Still declared, for the unreached functions that are checked, but not written
+                for declaration in instruction.declarations:
+                    name = declaration.declaredName()
+                    if name not in reached and name not in roots:
+                        ctx.prunedGlobals.add(name)
+                        ctx.stats['removed global ' + name] += 1
+
+    def generate(self):
+        for instruction in self.body:
+            instruction.generate()
+        Node.WriteStrings()
+        currentContext().emitter.flush()
+
+
+class NodeDeclaration(Node):
+    __slots__ = ('declType', 'declarations', 'line')
+
+    def __init__(self, declType, declarations, line):
+        self.declType = declType
+        self.declarations = declarations
+        self.line = line
+
+    def fold(self):
+        ctx = currentContext()
+        for node in self.declarations:
+            node.fold()
+            ctx.frameSize += node.size(self.declType)
+            strides = node.strides(self.declType)
+            if ctx.localNames is not None:
+                ctx.localNames[node.declaredName()] = strides
+            elif strides:
+                ctx.globalArrays[node.declaredName()] = strides
+        return self
+
+    def generate(self):
+        # Every declarator is in scope for the initializers of the ones that follow it
+        for node in self.declarations:
+            node.generate()
+            node.declare(self.line, self.declType)
+
+
 class NodeDeclarationAssign(Node):
+    __slots__ = ('rval', 'lval', 'idname', 'nodeType', 'value')
+
     def __init__(self, elmNode, expr=None, givenType=None):
         self.rval = expr
         self.lval = elmNode
         self.idname = None  # Eliminar
         self.nodeType = givenType
+        self.value = None
+
+    def fold(self):
+        if isinstance(self.lval, NodeArray):
+            self.lval.fold()
+        if self.rval is not None:
+            self.rval = self.rval.fold()
+        return self
+
+    def generate(self):
+        if isinstance(self.lval, NodeArray):
+            self.lval.generate()
+        # The values of globals are static and the elements of lists are stored one by one
+        if self.rval is not None and not isinstance(self.rval, NodeInitList) and \
+                currentContext().local_EBPoffsetTable is not None:
+            self.value = self.rval.generate()
+
+    def declaredName(self):
+        lval = self.lval
+        while isinstance(lval, NodeArray):
+            lval = lval.refNode
+        return lval
+
+    def size(self, givenType):
+        """Bytes taken by the variable, only constant array dimensions count in the size."""
+        varSize = givenType.size
+        lval = self.lval
+        while isinstance(lval, NodeArray):
+            if isinstance(lval.indxVal, NodeNum):
+                varSize *= lval.indxVal.numVal
+            lval = lval.refNode
+        # Every slot stays aligned to a word
+        return (varSize + 3) & ~3
+
+    def strides(self, givenType):
+        """Bytes between consecutive elements of every dimension, outermost first, empty for scalars."""
+        strides = []
+        stride = givenType.size
+        lval = self.lval
+        while isinstance(lval, NodeArray):
+            strides.append(stride)
+            if isinstance(lval.indxVal, NodeNum):
+                stride *= lval.indxVal.numVal
+            lval = lval.refNode
+        return tuple(reversed(strides))
+
+    def dimensions(self, line):
+        """Element counts of every dimension, outermost first, that have to be constants."""
+        dimensions = []
+        lval = self.lval
+        while isinstance(lval, NodeArray):
+            if not isinstance(lval.indxVal, NodeNum):
+                NodeError("Size of " + self.declaredName() + " is not a constant", line)
+            dimensions.append(lval.indxVal.numVal)
+            lval = lval.refNode
+        return dimensions[::-1]
+
+    def elements(self, line):
+        """Initial values of the elements in memory order, None for the ones left to zero."""
+        if isinstance(self.rval, NodeInitList):
+            return self.rval.flatten(self.dimensions(line), line)
+        return [self.rval]
+
+    def staticValues(self, line):
+        """Words of the initial value of a global, known at compile time."""
+        ctx = currentContext()
+        values = []
+        for element in self.elements(line):
+            if element is None:
+                values.append('0')
+            elif isinstance(element, NodeNum):
+                values.append(str(wrapInt32(element.numVal)))
+            elif isinstance(element, NodeUnaryRefs) and element.op == '&' and isinstance(element.p1, NodeId) and \
+                    element.p1.idname in ctx.EBPoffsetTable:
+                values.append(element.p1.idname)
+            elif isinstance(element, NodeId) and element.strides and element.idname in ctx.EBPoffsetTable:
+                # An array name is the address of its first element
+                values.append(element.idname)
+            else:
+                NodeError("Initializer of " + self.idname + " is not a constant", line)
+        return values
 
     def declare(self, line, givenType=None):
-        global EBPoffsetTable, counterEBP, typeTable
-        global local_EBPoffsetTable, local_counterEBP, local_typeTable
+        ctx = currentContext()
         # Obtain type and its size
         if givenType is not None:
             self.nodeType = givenType
-        varSize = self.nodeType.size
+        varSize = self.size(self.nodeType)
 
-        # Obtain array size multiplier and ID name
-        if isinstance(self.lval, NodeArray):
-            super().Write("movl $1, %eax")
-        while isinstance(self.lval, NodeArray):
-            self.nodeType = NodePointer(self.nodeType)
-            if isinstance(self.lval.indxVal, NodeNum):
-                sizeMult = "$" + self.lval.indxVal.val
-                varSize *= self.lval.indxVal.numVal
-            elif isinstance(self.lval.indxVal, NodeId):
-                sizeMult = EBPoffsetTable[self.lval.indxVal.val] + "(%ebp)"
-            else:
-                super().Write("popl %ebx")
-                sizeMult = "%ebx"
-            super().Write("imul " + sizeMult)
-            self.lval = self.lval.refNode
+        # Obtain type and ID name of arrays
+        lval = self.lval
+        while isinstance(lval, NodeArray):
+            self.nodeType = TYPES.pointer(self.nodeType)
+            lval = lval.refNode
 
         # Obtain name and check table
-        self.idname = self.lval
-        if local_EBPoffsetTable is None:
-            if self.idname in EBPoffsetTable:
+        self.idname = lval
+        if ctx.local_EBPoffsetTable is None:
+            if self.idname in ctx.EBPoffsetTable:
                 NodeError("Symbol " + self.idname + " is already declared!", line)
             else:
                 # Create table entries in Global Scope
-                typeTable[self.idname] = self.nodeType
-                EBPoffsetTable[self.idname] = str(counterEBP)
+                ctx.typeTable[self.idname] = self.nodeType
+                ctx.EBPoffsetTable[self.idname] = str(ctx.counterEBP)
+                ctx.sizeTable[self.idname] = varSize
 
-                # Initialize if necessary
+                # The initial value is written in the data section
                 if self.rval is not None:
-                    if isinstance(self.rval, NodeId):
-                        strOp1 = self.rval.val + "(%ebp)"
-                    elif isinstance(self.rval, NodeNum):
-                        strOp1 = "$" + self.rval.val
-                    elif isinstance(self.rval, NodeAssign):
-                        strOp1 = self.rval.lvalStr
-                    else:
-                        super().Write("popl %eax", "Pop assignment value")
-                        strOp1 = "%eax"
-
-                    super().Write("movl " + strOp1 + ", $" + self.idname,
-                                  self.idname + " = assignment")
+                    ctx.globalValues[self.idname] = self.staticValues(line)
         else:
-            if self.idname in local_EBPoffsetTable:
+            if self.idname in ctx.local_EBPoffsetTable:
                 NodeError("Symbol " + self.idname + " is already declared", line)
             else:
-                # Create table entries in Local Scope
-                local_typeTable[self.idname] = self.nodeType
-                local_EBPoffsetTable[self.idname] = str(local_counterEBP)
-
-                # Reserve space and update counter
-                local_counterEBP = local_counterEBP - varSize
-                super().Write("subl $" + str(varSize) + ", %esp",
-                              "Reserve space for " + self.idname + " (offset=" + local_EBPoffsetTable[
-                                  self.idname] + ")")
-
-                # Initialize if necessary
-                if self.rval is not None:
-                    if isinstance(self.rval, NodeId):
-                        strOp1 = self.rval.val + "(%ebp)"
-                    elif isinstance(self.rval, NodeNum):
-                        strOp1 = "$" + self.rval.val
-                    elif isinstance(self.rval, NodeAssign):
-                        strOp1 = self.rval.lvalStr
-                    else:
-                        super().Write("popl %eax", "Pop assignment value")
-                        strOp1 = "%eax"
-
-                    super().Write("movl " + strOp1 + ", " + local_EBPoffsetTable[self.idname] + "(%ebp)",
-                                  self.idname + " = assignment")
+                # Create table entries in Local Scope, the space is reserved in the prologue
+                # and arrays start at the lowest address of their slot
+                ctx.local_typeTable[self.idname] = self.nodeType
+                ctx.local_EBPoffsetTable[self.idname] = str(ctx.local_counterEBP + 4 - varSize)
+                ctx.local_counterEBP = ctx.local_counterEBP - varSize
+
+                # Initialize if necessary, the elements left out of a list to zero
+                offset = int(ctx.local_EBPoffsetTable[self.idname])
+                if isinstance(self.rval, NodeInitList):
+                    for index, element in enumerate(self.elements(line)):
+                        self.value = element.generate() if element is not None else "$0"
+                        self.initialize(str(offset + 4 * index) + "(%ebp)")
+                elif self.rval is not None:
+                    self.initialize(str(offset) + "(%ebp)")
+
+    def initialize(self, destination):
+        registers = currentContext().registers
+        value = self.value
+        if not isinstance(value, Temporary) and not isImmediate(value):
+            value = registers.load(value)
+        super().Write("movl " + str(value) + ", " + destination, self.idname + " = assignment")
+        registers.release(value)
+        self.value = None
+
+
+class NodeInitList(Node):
+    """Braced list of initial values of an array, items are expressions or nested lists."""
+    __slots__ = ('items', 'line')
+
+    def __init__(self, items, line):
+        self.items = items
+        self.line = line
+
+    def fold(self):
+        self.items = [item.fold() for item in self.items]
+        return self
+
+    def flatten(self, dimensions, line):
+        """Elements of an array of the given dimensions in memory order, None for the missing ones."""
+        rowSize = 1
+        for count in dimensions[1:]:
+            rowSize *= count
+        elements = []
+        for item in self.items:
+            if isinstance(item, NodeInitList):
+                if not dimensions:
+                    NodeError("Too many braces in the initializer", line)
+                # A nested list starts a new row and fills it
+                elements.extend([None] * (-len(elements) % rowSize))
+                elements.extend(item.flatten(dimensions[1:], line))
+            else:
+                elements.append(item)
+        total = rowSize * (dimensions[0] if dimensions else 1)
+        if len(elements) > total:
+            NodeError("Too many elements in the initializer", line)
+        return elements + [None] * (total - len(elements))
 
 
 class NodeAssign(Node):
+    __slots__ = ('lval', 'expr', 'line', 'nodeType', 'need')
+
     def __init__(self, lval, expr, line):
-        global EBPoffsetTable
-        if not isinstance(expr.nodeType, type(lval.nodeType)):
-            NodeError("Incompatible assignation types!", line)
+        self.lval = lval
+        self.expr = expr
+        self.line = line
+        self.nodeType = None
+        self.need = 1
+
+    def fold(self):
+        self.lval = self.lval.fold()
+        self.expr = self.expr.fold()
+        # A variable cannot be moved to memory directly, it goes through a register
+        valueNeed = max(self.expr.need, 1) if isinstance(self.expr, NodeId) else self.expr.need
+        if isinstance(self.lval, NodeUnaryRefs) and self.lval.op != '&':
+            # Assignments through pointers store to the memory operand of the left member
+            self.need = registerNeed(self.lval.need, valueNeed)
         else:
-            self.nodeType = lval.nodeType
-            if isinstance(lval, NodeNum):
-                NodeError("Left member of assignment is not a valid L-Value!", line)
-            else:
-                # Get Rval
-                if isinstance(expr, NodeId):
-                    assignment = expr.val
-                elif isinstance(expr, NodeNum):
-                    assignment = "$" + expr.val
-                elif isinstance(expr, NodeAssign):
-                    assignment = expr.lvalStr
-                else:
-                    super().Write("popl %eax", "Pop assignment value")
-                    assignment = "%eax"
-
-                # Get Lval
-                if local_EBPoffsetTable is None:
-                    if isinstance(lval, NodeId):
-                        self.lvalStr = lval.val
-                        super().Write("movl " + assignment + ", " + self.lvalStr,
-                                      lval.idname + " = assignment")
-                    elif isinstance(lval, NodeAssign):
-                        self.lvalStr = lval.lvalStr
-                        super().Write("movl " + assignment + ", " + self.lvalStr,
-                                      self.lvalStr + " = assignment")
-                    else:
-                        super().Write("popl %ebx", "Pop lval (address)")
-                        self.lvalStr = "%ebx"
-                        super().Write("movl " + assignment + ", PTR [" + self.lvalStr + "]",
-                                      "Assign rval to where lval points")
-                else:
-                    if isinstance(lval, NodeId):
-                        self.lvalStr = lval.val
-                        super().Write("movl " + assignment + ", " + self.lvalStr,
-                                      lval.idname + " = assignment")
-                    elif isinstance(lval, NodeAssign):
-                        self.lvalStr = lval.lvalStr
-                        super().Write("movl " + assignment + ", " + self.lvalStr,
-                                      self.lvalStr + " = assignment")
-                    else:
-                        super().Write("popl %ebx", "Pop lval (address)")
-                        self.lvalStr = "%ebx"
-                        super().Write("movl " + assignment + ", PTR [" + self.lvalStr + "]",
-                                      "Assign rval to where lval points")
+            self.need = registerNeed(0, valueNeed)
+        return self
+
+    def generate(self):
+        registers = currentContext().registers
+        lval = self.lval
+        expr = self.expr
+        destination = None
+        if isinstance(lval, NodeId) and not lval.strides:
+            lval.location()
+            value = expr.generate()
+        elif isinstance(lval, NodeUnaryRefs) and lval.op != '&' and not lval.decays():
+            # The value is kept while the address is computed, unless it needs every free register
+            value = expr.generate()
+            spilled = isinstance(value, Temporary) and registers.freeCount() < lval.need
+            if spilled:
+                registers.spill(value)
+            destination = lval.generateOperand()
+            if spilled:
+                registers.reload(value)
+        else:
+            NodeError("Left member of assignment is not a valid L-Value!", self.line)
+        if expr.nodeType is not lval.nodeType:
+            NodeError("Incompatible assignation types!", self.line)
+        self.nodeType = lval.nodeType
+
+        if not isinstance(value, Temporary) and not isImmediate(value):
+            value = registers.load(value, "Load assignment value")
+        if destination is None:
+            super().Write("movl " + str(value) + ", " + lval.val, lval.idname + " = assignment")
+        else:
+            super().Write("movl " + str(value) + ", " + str(destination), "Assign rval to where lval points")
+            for temporary in destination.temporaries:
+                registers.release(temporary)
+        return value
+
+
+class NodeExprStatement(Node):
+    __slots__ = ('expr',)
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def fold(self):
+        self.expr = self.expr.fold()
+        return self
+
+    def generate(self):
+        # The result is unused
+        currentContext().registers.release(self.expr.generate())
 
 
 class NodeIntCons(Node):
+    __slots__ = ('nodeType',)
+
     def __init__(self):
-        self.nodeType = NodeInt()
+        self.nodeType = TYPES.int
 
 
 class NodeArithmBinOp(Node):
+    __slots__ = ('p1', 'p2', 'op', 'line', 'nodeType', 'need')
+    instructions = {'+': "addl", '-': "subl", '*': "imull"}
+
     def __init__(self, p1, p2, op, line=None):
+        self.p1 = p1
+        self.p2 = p2
+        self.op = op
+        self.line = line
+        self.nodeType = None
+        self.need = 1
+
+    def fold(self):
+        self.p1 = self.p1.fold()
+        self.p2 = self.p2.fold()
+        if self.op in ('/', '%') and isinstance(self.p2, NodeNum) and self.p2.numVal == 0:
+            NodeWarning("Division by zero", self.line)
+        elif isinstance(self.p1, NodeNum) and isinstance(self.p2, NodeNum):
+            value = foldArithmetic(self.op, self.p1.numVal, self.p2.numVal)
+            if value is not None:
+                return NodeNum.fromValue(value, self.line)
+        if self.op == '*' and isinstance(self.p1, NodeNum):
+            # The constant factor goes second, to be strength reduced
+            self.p1, self.p2 = self.p2, self.p1
+        # The division takes %eax and %edx, and a third register for the divisor, but by a
+        # constant power of two it only takes a second register for the rounding
+        least = 1
+        if self.op in ('/', '%'):
+            least = 2 if isinstance(self.p2, NodeNum) and isPowerOfTwo(abs(self.p2.numVal)) else 3
+        self.need = registerNeed(self.p1.need, self.p2.need, least)
+        return self
+
+    def generate(self):
+        p1, p2, op = self.p1, self.p2, self.op
+        registers = currentContext().registers
+        operand1, operand2 = Node.generatePair(p1, p2)
+
         # Type Checking
-        if not isinstance(p1.nodeType, type(p2.nodeType)):
-            NodeError("Incompatible type of the operands!", line)
+        if p1.nodeType is not p2.nodeType:
+            NodeError("Incompatible type of the operands!", self.line)
         else:
             self.nodeType = p1.nodeType
 
-        # Operand 2
-        if isinstance(p2, NodeId):
-            super().Write("movl " + p2.val + ", %ebx", "Operand " + p2.idname + " (offset=" + p2.val + ")")
-            p2str = "%ebx"
-        elif isinstance(p2, NodeNum):
-            p2str = "$" + p2.val
+        if isinstance(p2, NodeNum) and op == '*':
+            result = registers.load(operand1, "First operand")
+            multiplyByConstant(result.register, p2.numVal)
+            return result
+        if isinstance(p2, NodeNum) and op in ('/', '%') and wrapInt32(p2.numVal) != 0:
+            return self.divideByConstant(operand1, wrapInt32(p2.numVal))
+        if op in ('/', '%'):
+            return self.divide(operand1, operand2)
+        instruction = self.instructions[op]
+        if isinstance(operand1, Temporary):
+            super().Write(instruction + " " + str(operand2) + ", " + operand1.register)
+            registers.release(operand2)
+            return operand1
+        if isinstance(operand2, Temporary):
+            # Only the second operand is in a register, the result is computed there
+            if op == '-':
+                super().Write("negl " + operand2.register)
+                super().Write("addl " + operand1 + ", " + operand2.register)
+            else:
+                super().Write(instruction + " " + operand1 + ", " + operand2.register)
+            return operand2
+        result = registers.load(operand1, "First operand")
+        super().Write(instruction + " " + operand2 + ", " + result.register)
+        return result
+
+    def divideByConstant(self, dividend, divisor):
+        """Divides without idivl, with shifts for powers of two and a magic multiplier otherwise."""
+        registers = currentContext().registers
+        currentContext().stats['strength reduced ' + self.op] += 1
+        magnitude = abs(divisor)
+        if not isPowerOfTwo(magnitude):
+            return self.divideByMagic(dividend, divisor)
+
+        result = registers.load(dividend, "Dividend")
+        shift = magnitude.bit_length() - 1
+        if shift == 0:
+            # By 1 or -1 there is no remainder
+            if self.op == '%':
+                super().Write("movl $0, " + result.register)
+            elif divisor < 0:
+                super().Write("negl " + result.register)
+            return result
+        # Negative dividends are rounded towards zero adding magnitude - 1 before shifting
+        bias = registers.allocate()
+        super().Write("movl " + result.register + ", " + bias.register)
+        if shift > 1:
+            super().Write("sarl $31, " + bias.register)
+        super().Write("shrl $" + str(32 - shift) + ", " + bias.register, "Rounding bias")
+        super().Write("addl " + bias.register + ", " + result.register)
+        if self.op == '%':
+            super().Write("andl $" + str(magnitude - 1) + ", " + result.register)
+            super().Write("subl " + bias.register + ", " + result.register, "Remainder")
         else:
-            super().Write("popl " + "%ebx", "Pop second operand from stack")
-            p2str = "%ebx"
-
-        # Operand 1
-        if isinstance(p1, NodeId):
-            super().Write("movl " + p1.val + ", %eax", "Operand " + p1.idname + " (offset=" + p1.val + ")")
-        elif isinstance(p1, NodeNum):
-            super().Write("movl $" + p1.val + ", %eax")
+            super().Write("sarl $" + str(shift) + ", " + result.register, "Quotient")
+            if divisor < 0:
+                super().Write("negl " + result.register)
+        registers.release(bias)
+        return result
+
+    def divideByMagic(self, dividend, divisor):
+        # The one operand imull leaves the high word of the product in %edx
+        registers = currentContext().registers
+        magnitude = abs(divisor)
+        multiplier, shift = divisionMagic(magnitude)
+        saved = registers.save([register for register in ('%eax', '%edx')
+                                if registers.owners.get(register) is not dividend])
+        if isinstance(dividend, Temporary) and dividend.register in ('%eax', '%edx'):
+            registers.move(dividend, registers.allocate(avoid=('%eax', '%edx')).register)
+        low, high = registers.claim('%eax'), registers.claim('%edx')
+        super().Write("movl $" + str(wrapInt32(multiplier)) + ", %eax", "Magic number of " + str(magnitude))
+        super().Write("imull " + str(dividend))
+        if multiplier >= 1 << 31:
+            super().Write("addl " + str(dividend) + ", %edx")
+        if shift:
+            super().Write("sarl $" + str(shift) + ", %edx")
+        # Negative dividends are rounded towards zero adding one
+        super().Write("movl " + str(dividend) + ", %eax")
+        super().Write("sarl $31, %eax")
+        super().Write("subl %eax, %edx", "Quotient of " + str(magnitude))
+        if self.op == '%':
+            multiplyByConstant('%edx', magnitude)
+            super().Write("movl " + str(dividend) + ", %eax")
+            super().Write("subl %edx, %eax", "Remainder")
+            result = low
+            registers.release(high)
         else:
-            super().Write("popl " + "%eax", "Pop first operand from stack")
-
-        # Operation
-        if op == '+':
-            super().Write("addl " + p2str + ', %eax')
-            super().Write("pushl %eax", "Push addition result")
-        elif op == '-':
-            super().Write("subl " + p2str + ', %eax')
-            super().Write("pushl %eax", "Push substraction result")
-        elif op == '*':
-            super().Write("imull " + p2str + ', %eax')
-            super().Write("pushl %eax", "Push multiplication result")
-        elif op == '/':
-            super().Write("cdq")
-            super().Write("idivl " + p2str)
-            super().Write("pushl %eax", "Push division result")
-        elif op == '%':
-            super().Write("cdq")
-            super().Write("idivl " + p2str)
-            super().Write("pushl %ebx", "Push modulus result")
+            if divisor < 0:
+                super().Write("negl %edx")
+            result = high
+            registers.release(low)
+        registers.release(dividend)
+        savedRegisters = [temporary.register for temporary in saved]
+        if result.register in savedRegisters:
+            registers.move(result, registers.allocate(avoid=savedRegisters).register)
+        registers.restore(saved)
+        return result
+
+    def divide(self, dividend, divisor):
+        # idivl divides %edx:%eax, leaving the quotient in %eax and the remainder in %edx
+        registers = currentContext().registers
+        saved = registers.save([register for register in ('%eax', '%edx')
+                                if registers.owners.get(register) not in (dividend, divisor)])
+        if isinstance(divisor, Temporary) and divisor.register == '%eax':
+            if isinstance(dividend, Temporary):
+                super().Write("xchgl " + dividend.register + ", %eax")
+                registers.owners[dividend.register], registers.owners['%eax'] = divisor, dividend
+                divisor.register, dividend.register = dividend.register, '%eax'
+            else:
+                registers.move(divisor, registers.allocate(avoid=('%eax', '%edx')).register)
+        if not isinstance(dividend, Temporary) or dividend.register != '%eax':
+            super().Write("movl " + str(dividend) + ", %eax", "Dividend")
+            registers.release(dividend)
+            dividend = registers.claim('%eax')
+        if isImmediate(divisor) or isinstance(divisor, Temporary) and divisor.register == '%edx':
+            moved = registers.allocate(avoid=('%eax', '%edx'))
+            super().Write("movl " + str(divisor) + ", " + moved.register, "Divisor")
+            registers.release(divisor)
+            divisor = moved
+        super().Write("cdq")
+        super().Write("idivl " + str(divisor))
+        registers.release(divisor)
+        result = dividend
+        if self.op == '%':
+            registers.release(dividend)
+            result = registers.claim('%edx')
+        savedRegisters = [temporary.register for temporary in saved]
+        if result.register in savedRegisters:
+            registers.move(result, registers.allocate(avoid=savedRegisters).register)
+        registers.restore(saved)
+        return result
 
 
 class NodeRelationalBinOp(Node):
+    __slots__ = ('p1', 'p2', 'op', 'line', 'nodeType', 'need')
+    # Comparison that holds when the operands are exchanged
+    mirrored = {'>': '<', '>=': '<=', '<': '>', '<=': '>=', '==': '==', '!=': '!='}
+
     def __init__(self, p1, p2, op, line):
-        self.ID = newLabelID()
+        self.p1 = p1
+        self.p2 = p2
+        self.op = op
+        self.line = line
+        self.nodeType = None
+        self.need = 1
+
+    def fold(self):
+        self.p1 = self.p1.fold()
+        self.p2 = self.p2.fold()
+        if isinstance(self.p1, NodeNum) and isinstance(self.p2, NodeNum):
+            return NodeNum.fromValue(foldRelational(self.op, self.p1.numVal, self.p2.numVal), self.line)
+        self.need = registerNeed(self.p1.need, self.p2.need)
+        return self
+
+    def generate(self):
+        return conditionValue(self.compare(), "Set the result of the comparison")
+
+    def branch(self, label, when):
+        condition = self.compare()
+        super().Write("j" + (condition if when else negatedConditions[condition]) + " " + label)
+
+    def compare(self):
+        """Compares the operands and returns the condition code that holds when the comparison is true."""
+        p1, p2, op = self.p1, self.p2, self.op
+        registers = currentContext().registers
+        operand1, operand2 = Node.generatePair(p1, p2)
 
         # Type Checking
-        if not isinstance(p1.nodeType, type(p2.nodeType)):
-            NodeError("Incompatible type of the operands!", line)
+        if p1.nodeType is not p2.nodeType:
+            NodeError("Incompatible type of the operands!", self.line)
         else:
             self.nodeType = p1.nodeType
 
-        # Operand 2
-        if isinstance(p2, NodeId):
-            super().Write("movl " + p2.val + ", %ebx", "Operand " + p2.idname + " (offset=" + p2.val + ")")
-            p2str = "%ebx"
-        elif isinstance(p2, NodeNum):
-            p2str = "$" + p2.val
-        else:
-            super().Write("popl " + "%ebx", "Pop second operand")
-            p2str = "%ebx"
-
-        # Operand 1
-        if isinstance(p1, NodeId):
-            p1str = p1.val
-        elif isinstance(p1, NodeNum):
-            p1str = "$" + p1.val
-        else:
-            super().Write("popl " + "%eax", "Pop first operand")
-            p1str = "%eax"
+        # cmpl needs its second operand in a register or in memory, and one of them in a register
+        if isImmediate(operand1) and not isImmediate(operand2):
+            operand1, operand2, op = operand2, operand1, self.mirrored[op]
+        if not isinstance(operand1, Temporary) and (isImmediate(operand1) or not isinstance(operand2, Temporary)
+                                                    and not isImmediate(operand2)):
+            operand1 = registers.load(operand1, "First operand")
 
         # Operation
-        super().Write("movl $1, %ecx", "Assume condition is true")
-        super().Write("cmp " + p1str + ", " + p2str, "Compare both Operands")
-        if op == '>':
-            super().Write("jg condTrue" + str(self.ID))
-        elif op == '>=':
-            super().Write("jge condTrue" + str(self.ID))
-        elif op == '<':
-            super().Write("jl condTrue" + str(self.ID))
-        elif op == '<=':
-            super().Write("jle condTrue" + str(self.ID))
-        elif op == '==':
-            super().Write("je condTrue" + str(self.ID))
-        elif op == '!=':
-            super().Write("jne condTrue" + str(self.ID))
-
-        super().Write("movl $0, %ecx", "Reached if condition is false, set result as false")
-        super().WriteLabel("condTrue" + str(self.ID))
-        super().Write("pushl %ecx", "Push result")
+        super().Write("cmpl " + str(operand2) + ", " + str(operand1), "Compare both Operands")
+        registers.release(operand1)
+        registers.release(operand2)
+        return conditionCodes[op]
 
 
 class NodeLogical(Node):
-    def __init__(self, op):
+    __slots__ = ('op', 'p1', 'p2', 'ID', 'nodeType', 'need')
+
+    def __init__(self, op, p1, p2=None):
         self.op = op
-        self.ID = newLabelID()
+        self.p1 = p1
+        self.p2 = p2
+        self.ID = None
         self.nodeType = None
+        self.need = 1
+
+    def fold(self):
+        self.p1 = self.p1.fold()
+        self.p2 = self.p2.fold()
+        if isinstance(self.p1, NodeNum):
+            first = wrapInt32(self.p1.numVal) != 0
+            # The first operand alone decides, the second one is never evaluated
+            if self.op == '&&' and not first:
+                return NodeNum.fromValue(0, self.p1.line)
+            if self.op == '||' and first:
+                return NodeNum.fromValue(1, self.p1.line)
+            if isinstance(self.p2, NodeNum):
+                return NodeNum.fromValue(int(wrapInt32(self.p2.numVal) != 0), self.p1.line)
+        # The operands are evaluated one after the other
+        self.need = registerNeed(max(self.p1.need, self.p2.need), 0)
+        return self
+
+    def generate(self):
+        registers = currentContext().registers
+        self.ID = newLabelID()
+        self.branch("shortcut" + str(self.ID), self.op == '||')
 
-    def firstOperand(self, p):
-        self.nodeType = p.nodeType
-        if isinstance(p, NodeId):
-            super().Write("movl " + p.val + ", %eax",
-                          "(" + self.op + " operator) Operand " + p.idname + " (offset=" + p.val + ")")
-            operand = "%eax"
-        elif isinstance(p, NodeNum):
-            operand = "$" + p.val
-        else:
-            super().Write("popl " + "%eax", "(" + self.op + " operator) Pop first operand")
-            operand = "%eax"
-
-        super().Write("cmpl " + "$0, " + operand, "check if first operand is false")
+        # Both operands were evaluated without deciding the result before
+        result = registers.allocate()
         if self.op == '&&':
-            super().Write("pushl $0", "assume first operand is false")
-            super().Write("je shortcut" + str(self.ID), "if first operand is false, jump to end")
-        elif self.op == '||':
-            super().Write("pushl $1", "assume first operand is true")
-            super().Write("jne shortcut" + str(self.ID), "if first operand is true, jump to end")
-
-    def secondOperand(self, p):
-        self.nodeType = p.nodeType
-        if isinstance(p, NodeId):
-            super().Write("movl " + p.val + ", %eax",
-                          "(" + self.op + " operator) Operand " + p.idname + " (offset=" + p.val + ")")
-            operand = "%eax"
-        elif isinstance(p, NodeNum):
-            operand = "$" + p.val
+            super().Write("movl $1, " + result.register, "both operands are true")
         else:
-            super().Write("popl " + "%eax", "(" + self.op + " operator) Pop second operand")
-            operand = "%eax"
-
-        super().Write("cmpl " + "$0, " + operand, "check if second operand is false")
-        if self.op == '&&':
-            super().Write("movl $0, %eax", "assume operator && result is False")
-            super().Write("je shortcut" + str(self.ID), "if second operand is False, jump")
-            super().Write("movl $1, %eax", "else, negate assumption")
-        elif self.op == '||':
-            super().Write("movl $1, %eax", "assume operator || result is True")
-            super().Write("jne shortcut" + str(self.ID), "if second operand is True, jump")
-            super().Write("movl $0, %eax", "else, negate assumption")
-        super().Write("popl %ebx", "Remove result of first operand")
-        super().Write("pushl %eax", "Push final operator result")
+            super().Write("movl $0, " + result.register, "both operands are false")
+        super().Write("jmp shortcutEnd" + str(self.ID))
         super().WriteLabel("shortcut" + str(self.ID))
+        if self.op == '&&':
+            super().Write("movl $0, " + result.register, "an operand is false")
+        else:
+            super().Write("movl $1, " + result.register, "an operand is true")
+        super().WriteLabel("shortcutEnd" + str(self.ID))
+        return result
+
+    def branch(self, label, when):
+        # An operand with this value decides the result, and the second one is not evaluated
+        decisive = self.op == '||'
+        if when == decisive:
+            self.p1.branch(label, when)
+            self.p2.branch(label, when)
+        else:
+            skip = "shortcut" + str(newLabelID())
+            self.p1.branch(skip, decisive)
+            self.p2.branch(label, when)
+            super().WriteLabel(skip)
+        self.nodeType = self.p2.nodeType
 
 
 class NodeUnaryOp(Node):
+    __slots__ = ('op', 'p1', 'line', 'nodeType', 'need')
+
     def __init__(self, p1, op, line):
         self.op = op
         self.p1 = p1
+        self.line = line
+        self.nodeType = None
+        self.need = 1
+
+    def fold(self):
+        self.p1 = self.p1.fold()
+        if isinstance(self.p1, NodeNum):
+            value = wrapInt32(self.p1.numVal)
+            return NodeNum.fromValue(int(value == 0) if self.op == '!' else wrapInt32(-value), self.line)
+        self.need = registerNeed(self.p1.need, 0)
+        return self
+
+    def generate(self):
+        p1, op = self.p1, self.op
+        registers = currentContext().registers
+
+        if op == '!' and isinstance(p1, NodeRelationalBinOp):
+            condition = negatedConditions[p1.compare()]
+            self.nodeType = p1.nodeType
+            return conditionValue(condition, "Set the result of the negated comparison")
+        operand = p1.generate()
 
         if op == '!':
             # Type Checking
             self.nodeType = p1.nodeType
             # Operand
-            if isinstance(p1, NodeId):
-                super().Write("movl " + p1.val + ", %eax", "(! operator) " + p1.val + " = " + p1.idname)
-            elif isinstance(p1, NodeNum):
-                super().Write("movl $" + p1.val + ", %eax")
-            else:
-                super().Write("popl " + "%eax", "(! operator) Pop unary operand")
-
-            super().Write("cmp $0, %eax", "Check if operand is false")
-            super().Write("movl $1, %eax", "Set as true (negation)")
-            labelID = str(newLabelID())
-            super().Write("je " + "negFinal" + labelID, "Jump if false")
-            super().Write("movl $0, %eax", "Set as false (negation)")
-            super().WriteLabel("negFinal" + labelID)
-            super().Write("puslh %eax", "Push result")
+            if isImmediate(operand):
+                operand = registers.load(operand)
+            super().Write("cmpl $0, " + str(operand), "Check if operand is false")
+            registers.release(operand)
+            return conditionValue('e', "Set as true if false (negation)")
 
         elif op == '-':
-            if not isinstance(p1.nodeType, NodeInt):
-                NodeError("Incompatible type for unary minus operand!", line)
+            if p1.nodeType is not TYPES.int:
+                NodeError("Incompatible type for unary minus operand!", self.line)
             else:
                 self.nodeType = p1.nodeType
 
-            # Operand
-            if isinstance(p1, NodeId):
-                super().Write("movl " + p1.val + ", %eax", "(Unary -) " + p1.val + " = " + p1.idname)
-            elif isinstance(p1, NodeNum):
-                super().Write("movl $" + p1.val + ", %eax")
-            else:
-                super().Write("popl " + "%eax", "(! operator) Pop unary operand")
-
-            super().Write("imul $-1")
-            super().Write("pushl %eax")
+            result = registers.load(operand)
+            super().Write("negl " + result.register, "Unary minus")
+            return result
         else:
             raise RuntimeError('Invalid operation')
 
+    def branch(self, label, when):
+        if self.op != '!':
+            return super().branch(label, when)
+        # The negation only swaps the truth value the operand branches on
+        self.p1.branch(label, not when)
+        self.nodeType = self.p1.nodeType
+
 
 class NodeUnaryRefs(Node):
+    """Pointer operators & and *, and subscripts [].
+
+    Subscripts address the element at p1 + (offsetExpr + displacement) elements. When levels
+    is not 0, p1 is a declared array and levels of its subscripts are merged in offsetExpr
+    with the row strides of the array, otherwise p1 is a pointer.
+    """
+    __slots__ = ('op', 'p1', 'line', 'offsetExpr', 'nodeType', 'need', 'displacement', 'levels')
+
     def __init__(self, p1, op, line, offsetExpr=None):
-        global EBPoffsetTable, typeTable
         self.op = op
         self.p1 = p1
-
-        if op == '&':
-            if isinstance(p1, NodeId):
-                self.nodeType = NodePointer(p1.nodeType)
-                super().Write("movl " + p1.val + ", %eax", "(& Operator) %eax = " + p1.idname)
-            elif isinstance(p1, NodeNum):
-                NodeError("Reference '&' operator can only be applied to variable identifers", line)
+        self.line = line
+        self.offsetExpr = offsetExpr
+        self.nodeType = None
+        self.need = 1
+        self.displacement = None
+        self.levels = 0
+
+    def fold(self):
+        self.p1 = self.p1.fold()
+        if self.offsetExpr is not None:
+            self.offsetExpr = self.offsetExpr.fold()
+        if self.op == '[]':
+            if self.displacement is None:
+                self.foldSubscript()
+            offsetNeed = max(self.offsetExpr.need, 1) if self.offsetExpr is not None else 0
+            if self.levels:
+                # The array is addressed from %ebp or its symbol, the element is loaded in the index register
+                self.need = registerNeed(max(offsetNeed, 1), 0)
             else:
-                super().Write("popl %eax", "(& Operator) Pop unary operand")
-            super().Write("leal %eax, %eax", "Obtain operand's effective address")
-            super().Write("pushl %eax", "Push result")
+                # The pointer and the offset are both in registers, unless the offset is constant
+                self.need = registerNeed(max(self.p1.need, 1), offsetNeed)
+        else:
+            self.need = registerNeed(self.p1.need, 0)
+        return self
+
+    def foldSubscript(self):
+        """Splits the subscript into a constant displacement and an offset counted in elements."""
+        p1, offset, line = self.p1, self.offsetExpr, self.line
+        index, displacement, stride = None, 0, 1
+        if isinstance(p1, NodeId) and p1.strides:
+            self.levels = 1
+        elif isinstance(p1, NodeUnaryRefs) and p1.op == '[]' and p1.decays():
+            # The subscripts of a multidimensional array make a single access
+            self.levels = p1.levels + 1
+            index, displacement, p1 = p1.offsetExpr, p1.displacement, p1.p1
+        if self.levels:
+            stride = p1.strides[self.levels - 1] // p1.strides[-1]
+
+        # Constants added to the subscript go to the displacement
+        if isinstance(offset, NodeNum):
+            displacement += offset.numVal * stride
+            offset = None
+        elif isinstance(offset, NodeArithmBinOp) and offset.op in ('+', '-') and isinstance(offset.p2, NodeNum):
+            displacement += (offset.p2.numVal if offset.op == '+' else -offset.p2.numVal) * stride
+            offset = offset.p1
+        elif isinstance(offset, NodeArithmBinOp) and offset.op == '+' and isinstance(offset.p1, NodeNum):
+            displacement += offset.p1.numVal * stride
+            offset = offset.p2
+        if offset is not None:
+            if stride != 1:
+                offset = NodeArithmBinOp(offset, NodeNum.fromValue(stride, line), '*', line)
+            if index is not None:
+                offset = NodeArithmBinOp(index, offset, '+', line)
+            offset = offset.fold()
+        else:
+            offset = index
+        self.p1, self.offsetExpr, self.displacement = p1, offset, wrapInt32(displacement)
 
-        elif op == '*':
-            if not isinstance(p1.nodeType, NodePointer):
-                NodeError("Operand is not a pointer!", line)
-            else:
-                self.nodeType = p1.nodeType.refNode
+    def decays(self):
+        """Whether the subscripts leave a row of an array, whose value is its address."""
+        return self.op == '[]' and 0 < self.levels < len(self.p1.strides)
 
-            if isinstance(p1, NodeNum):
-                NodeError("Operand is not a pointer!", line)
-            elif isinstance(p1, NodeId):
-                super().Write("movl " + p1.val + ", %eax", "(* Operator) %eax = " + p1.idname)
-            else:
-                super().Write("popl %eax", "(* Operator) Pop unary operand")
-            super().Write("movl PTR [%eax], %eax", "Dereference pointer")
-            super().Write("pushl %eax", "Push result")
+    def generate(self):
+        p1, op, line = self.p1, self.op, self.line
+        registers = currentContext().registers
 
-        elif op == '[]':
-            if not isinstance(p1.nodeType, NodePointer):
-                NodeError("Is not a pointer!", line)
-            else:
-                self.nodeType = p1.nodeType.refNode
+        if op == '&':
+            if isinstance(p1, NodeId):
+                p1.location()
+                self.nodeType = TYPES.pointer(p1.nodeType)
+                address = registers.allocate()
+                super().Write("leal " + p1.val + ", " + address.register, "(& Operator) &" + p1.idname)
+                return address
+            elif isinstance(p1, NodeUnaryRefs) and p1.op != '&':
+                address = p1.generateAddress()
+                self.nodeType = TYPES.pointer(p1.nodeType)
+                return address
+            NodeError("Reference '&' operator can only be applied to variable identifers", line)
+
+        elif op in ('*', '[]'):
+            if self.decays():
+                return self.generateAddress()
+            operand = self.generateOperand()
+            if not operand.temporaries:
+                # A constant subscript of an array is a memory operand, as a variable is
+                return str(operand)
+            result = self.resultRegister(operand)
+            super().Write("movl " + str(operand) + ", " + result.register, "Dereference Address")
+            return result
+        else:
+            raise RuntimeError('Invalid operation')
 
-            # Calculate Offset
-            if isinstance(offsetExpr, NodeNum):
-                offset = "$" + offsetExpr.val
-            elif isinstance(offsetExpr, NodeId):
-                offset = offsetExpr.val
-            else:
-                super().Write("popl %eax", "([] Operator) Pop offset literal")
-                offset = "%eax"
-            super().Write("imul $" + str(p1.nodeType.size) + ", " + offset, "Calculate Offset")
-            super().Write("movl %eax, %ebx", "Store Offset in ebx")
+    def generateAddress(self):
+        """Generates the address this node dereferences and returns its Temporary."""
+        operand = self.generateOperand()
+        if len(operand.temporaries) == 1 and str(operand) == "(" + operand.temporaries[0].register + ")":
+            return operand.temporaries[0]
+        result = self.resultRegister(operand)
+        super().Write("leal " + str(operand) + ", " + result.register, "Address = Pointer + Offset")
+        return result
 
-            # Obtain base address
-            if isinstance(p1, NodeNum):
+    @staticmethod
+    def resultRegister(operand):
+        """Register of the address of an operand that takes its value, the others are released."""
+        registers = currentContext().registers
+        if not operand.temporaries:
+            return registers.allocate()
+        for temporary in operand.temporaries[1:]:
+            registers.release(temporary)
+        return operand.temporaries[0]
+
+    def generateOperand(self):
+        """Generates the address this node dereferences and returns its MemoryOperand."""
+        p1, op, line, offsetExpr = self.p1, self.op, self.line, self.offsetExpr
+        registers = currentContext().registers
+
+        if op == '*':
+            pointer = p1.generate()
+            if isinstance(p1, NodeNum) or not isinstance(p1.nodeType, NodePointer):
                 NodeError("Operand is not a pointer!", line)
-            elif isinstance(p1, NodeId):
-                super().Write("movl " + p1.val + ", %eax", "([] Operator) %eax = " + p1.idname)
-            else:
-                super().Write("popl %eax", "([] Operator) Pop unary operand")
-
-            super().Write("addl %ebx", "Address = Pointer + Offset")
-            super().Write("movl PTR [%eax], %eax", "Dereference Address")
-            super().Write("pushl %eax", "Push result")
+            self.nodeType = p1.nodeType.refNode
+            address = registers.load(pointer, "(* Operator) Pointer")
+            return MemoryOperand("(" + address.register + ")", [address])
+
+        if self.levels:
+            # The array is not loaded, its elements are addressed from its location
+            base = p1.location()
+            nodeType = p1.nodeType
+            for _ in range(self.levels):
+                nodeType = nodeType.refNode
+            self.nodeType = nodeType
+            scale = p1.strides[-1]
+            temporaries = []
+            offset = offsetExpr.generate() if offsetExpr is not None else None
         else:
-            raise RuntimeError('Invalid operation')
+            if offsetExpr is not None:
+                pointer, offset = Node.generatePair(p1, offsetExpr)
+            else:
+                pointer, offset = p1.generate(), None
+            if isinstance(p1, NodeNum) or not isinstance(p1.nodeType, NodePointer):
+                NodeError("Operand is not a pointer!", line)
+            self.nodeType = p1.nodeType.refNode
+            scale = p1.nodeType.elementSize
+            base = registers.load(pointer, "([] Operator) Pointer")
+            temporaries = [base]
+            base = base.register
+
+        index = None
+        if offset is not None:
+            index = registers.load(offset, "([] Operator) Index")
+            temporaries.append(index)
+            if scale not in (1, 2, 4, 8):
+                multiplyByConstant(index.register, scale, "Calculate Offset")
+            index = index.register
+        displacement = self.displacement * scale
+        if scale not in (1, 2, 4, 8):
+            scale = 1
+        return MemoryOperand(memoryAddress(base, displacement, index, scale), temporaries)
 
 
 class NodePrint(Node):
-    def __init__(self, line, string, *values):
-        if values:
-            try:
-                values = list(values[0])
-            except TypeError as te:
-                values = list(values)
+    __slots__ = ('line', 'string', 'values')
 
-            values = values[::-1]
+    def __init__(self, line, string, values=()):
+        self.line = line
+        self.string = string
+        self.values = values
 
-            # Check number of specifiers and number of values
-            if len(values) != string.count('%d'):
-                NodeError('Number of parameters is different from the number of specifiers', line)
-        else:
-            if string.count('%d') > 0:
-                NodeError('Number of parameters is different from the number of specifiers', line)
-        pass
+    def fold(self):
+        self.values = [value.fold() for value in self.values]
+        return self
 
-    def execute(self):
-        pass
+    def generate(self):
+        ctx = currentContext()
+        ctx.registers.release(NodeFunctionCall.callFunction('printf', self.values, self.string))
+
+        # Check number of specifiers and number of values
+        if len(self.values) != self.string.count('%d'):
+            NodeError('Number of parameters is different from the number of specifiers', self.line)
 
 
 class NodeScan(Node):
-    def __init__(self, line, string, *values):
-        if values:
-            try:
-                values = list(values[0])
-            except TypeError as te:
-                values = list(values)
+    __slots__ = ('line', 'string', 'values')
+    nodeType = TYPES.int
+    need = 1
 
-            values = values[::-1]
+    def __init__(self, line, string, values=()):
+        self.line = line
+        self.string = string
+        self.values = values
 
-            # Check number of specifiers and number of values
-            if len(values) != string.count('%d'):
-                NodeError("Number of parameters is different from the number of specifiers", line)
-        else:
-            if string.count('%d') > 0:
-                NodeError("Number of parameters is different from the number of specifiers", line)
-        pass
+    def fold(self):
+        self.values = [value.fold() for value in self.values]
+        return self
 
-    def execute(self):
-        pass
+    def generate(self):
+        result = NodeFunctionCall.callFunction('scanf', self.values, self.string)
+
+        # Check number of specifiers and number of values
+        if len(self.values) != self.string.count('%d'):
+            NodeError("Number of parameters is different from the number of specifiers", self.line)
+        return result
 
 
 class NodeIf(Node):
-    def __init__(self, ID):
-        self.ID = ID
-
-    def compare(self, expr):
-        if isinstance(expr, NodeId):
-            super().Write("movl " + expr.val + ", %eax", "Condition " + expr.idname + " (offset=" + expr.val + ")")
-        elif isinstance(expr, NodeNum):
-            super().Write("movl $" + expr.val + ", %eax", "Condition = " + expr.val)
+    __slots__ = ('cond', 'body', 'elseBody', 'ID')
+
+    def __init__(self, cond, body, elseBody=None):
+        self.cond = cond
+        self.body = body
+        self.elseBody = elseBody
+        self.ID = None
+
+    def fold(self):
+        self.cond = self.cond.fold()
+        self.body = foldInstructions(self.body)
+        if self.elseBody is not None:
+            self.elseBody = foldInstructions(self.elseBody)
+        return self
+
+    def generate(self):
+        self.ID = newLabelID()
+        # The condition jumps straight to the else part when false
+        self.cond.branch('false' + str(self.ID), False)
+        for instruction in self.body:
+            instruction.generate()
+        if self.elseBody is None:
+            self.falseLabel()
         else:
-            super().Write('popl %eax', "Pop condition value")
-
-        super().Write('cmpl $0, %eax', "Compare IF condition")
-        super().Write('je false' + str(self.ID))
+            self.finalJump()
+            self.falseLabel()
+            for instruction in self.elseBody:
+                instruction.generate()
+            self.finalLabel()
 
     def finalJump(self):
         super().Write('jmp final' + str(self.ID))
@@ -656,24 +2475,44 @@ class NodeIf(Node):
 
 
 class NodeWhile(Node):
-    def __init__(self, ID):
-        self.ID = ID
+    """While loop, preheader holds the invariants of the loop computed once before it starts."""
+    __slots__ = ('cond', 'body', 'ID', 'preheader')
+
+    def __init__(self, cond, body):
+        self.cond = cond
+        self.body = body
+        self.ID = None
+        self.preheader = []
+
+    def fold(self):
+        ctx = currentContext()
+        self.cond = self.cond.fold()
+        self.body = foldInstructions(self.body)
+        # Only the loops of functions have a frame to keep the invariants in
+        if ctx.options.licm and ctx.localNames is not None:
+            invariants = LoopInvariants(ctx.localNames, ctx.addressTaken)
+            invariants.scan([self.cond, self.body])
+            self.cond = invariants.hoist(self.cond, self.preheader)
+            self.body = invariants.hoist(self.body, self.preheader)
+            ctx.frameSize += 4 * invariants.created
+            if self.preheader:
+                ctx.stats['loop invariants hoisted'] += invariants.created
+        return self
+
+    def generate(self):
+        self.ID = newLabelID()
+        for invariant in self.preheader:
+            invariant.hoist()
+        self.startLabel()
+        self.cond.branch('final' + str(self.ID), False)
+        for instruction in self.body:
+            instruction.generate()
+        self.jumpStart()
+        self.finalLabel()
 
     def startLabel(self):
         super().WriteLabel('start' + str(self.ID))
 
-    def compare(self, expr):
-        if isinstance(expr, NodeId):
-            super().Write("movl " + expr.val + ", %eax",
-                          "Condition " + expr.idname + " (offset=" + expr.val + ")")
-        elif isinstance(expr, NodeNum):
-            super().Write("movl $" + expr.val + ", %eax", "Condition = " + expr.val)
-        else:
-            super().Write('popl %eax', "Pop condition value")
-
-        super().Write('cmpl $0, %eax', "Compare WHILE condition")
-        super().Write('jne final' + str(self.ID))
-
     def jumpStart(self):
         super().Write('jmp start' + str(self.ID))
 
@@ -684,117 +2523,780 @@ class NodeWhile(Node):
         super().WriteLabel('final' + str(self.ID))
 
 
+class NodeInvariant(Node):
+    """Loop invariant expression, computed into a frame slot by the preheader of its loop."""
+    __slots__ = ('expr', 'slot', 'nodeType')
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.slot = None
+        self.nodeType = None
+
+    def hoist(self):
+        ctx = currentContext()
+        registers = ctx.registers
+        value = self.expr.generate()
+        self.nodeType = self.expr.nodeType
+        self.slot = str(ctx.local_counterEBP) + "(%ebp)"
+        ctx.local_counterEBP -= 4
+        if not isinstance(value, Temporary) and not isImmediate(value):
+            value = registers.load(value)
+        super().Write("movl " + str(value) + ", " + self.slot, "Hoisted loop invariant")
+        registers.release(value)
+
+    def generate(self):
+        return self.slot
+
+
+class LoopInvariants:
+    """Finds the expressions of a loop whose value does not change while it runs.
+
+    An expression is invariant when it has no side effects, cannot trap, and none of the
+    variables it reads is assigned or declared in the loop. Calls and stores through
+    pointers may write any global and any local whose address is taken, so in loops with
+    them only the other locals are invariant.
+    """
+    # Slots whose subtree is not evaluated as a value
+    skippedSlots = ('lval', 'nodeType')
+
+    def __init__(self, localNames, addressTaken):
+        self.localNames = localNames
+        self.addressTaken = addressTaken
+        self.assigned = set()
+        self.declared = set()
+        self.writesMemory = False
+        # Number of NodeInvariant nodes made, the ones moved from nested loops have a slot already
+        self.created = 0
+
+    @staticmethod
+    def addressesTaken(node, found=None):
+        """Names of the variables the & operator is applied to in a subtree."""
+        if found is None:
+            found = set()
+        if isinstance(node, NodeUnaryRefs) and node.op == '&' and isinstance(node.p1, NodeId):
+            found.add(node.p1.idname)
+        if isinstance(node, Node):
+            for slot in nodeSlots(node):
+                LoopInvariants.addressesTaken(getattr(node, slot, None), found)
+        elif isinstance(node, list):
+            for item in node:
+                LoopInvariants.addressesTaken(item, found)
+        return found
+
+    def scan(self, node):
+        """Collects the variables the subtree assigns or declares and whether it writes memory."""
+        if isinstance(node, list):
+            for item in node:
+                self.scan(item)
+            return
+        if not isinstance(node, Node) or isinstance(node, NodeFunction):
+            return
+        if isinstance(node, NodeAssign):
+            if isinstance(node.lval, NodeId):
+                self.assigned.add(node.lval.idname)
+            else:
+                self.writesMemory = True
+        elif isinstance(node, NodeDeclarationAssign):
+            self.assigned.add(node.declaredName())
+            self.declared.add(node.declaredName())
+        elif isinstance(node, (NodeFunctionCall, NodeScan)):
+            self.writesMemory = True
+        for slot in nodeSlots(node):
+            if slot != 'nodeType':
+                self.scan(getattr(node, slot, None))
+
+    def unchanged(self, name):
+        if name in self.assigned:
+            return False
+        return not self.writesMemory or name in self.localNames and name not in self.addressTaken
+
+    def invariant(self, node):
+        if isinstance(node, NodeNum):
+            return True
+        if isinstance(node, NodeId):
+            return self.unchanged(node.idname)
+        if isinstance(node, NodeArithmBinOp):
+            # Only divisions by non zero constants cannot trap
+            if node.op in ('/', '%') and not (isinstance(node.p2, NodeNum) and wrapInt32(node.p2.numVal) != 0):
+                return False
+            return self.invariant(node.p1) and self.invariant(node.p2)
+        if isinstance(node, (NodeRelationalBinOp, NodeLogical)):
+            return self.invariant(node.p1) and self.invariant(node.p2)
+        if isinstance(node, NodeUnaryOp):
+            return self.invariant(node.p1)
+        if isinstance(node, NodeUnaryRefs) and node.op == '&':
+            # The address of a variable is fixed once it is declared, loads are not invariant
+            target = node.p1
+            if isinstance(target, NodeId):
+                return target.idname not in self.declared
+            if isinstance(target, NodeUnaryRefs) and target.op != '&':
+                return self.invariant(target.p1) and (target.offsetExpr is None
+                                                      or self.invariant(target.offsetExpr))
+        return False
+
+    @staticmethod
+    def worthHoisting(node):
+        if isinstance(node, (NodeNum, NodeId, NodeInvariant)):
+            return False
+        # Taking the address of a variable costs as much as loading it from the frame
+        return not (isinstance(node, NodeUnaryRefs) and node.op == '&' and isinstance(node.p1, NodeId))
+
+    def hoist(self, node, preheader):
+        """Replaces the largest invariant subexpressions of the subtree by NodeInvariant nodes.
+
+        The new nodes are appended to preheader, returns the node that replaces node.
+        """
+        if isinstance(node, list):
+            return [self.hoist(item, preheader) for item in node]
+        # The invariants of this loop found through a nested loop are already placed
+        if not isinstance(node, Node) or isinstance(node, NodeFunction) or node in preheader:
+            return node
+        if self.worthHoisting(node) and self.invariant(node):
+            invariant = NodeInvariant(node)
+            preheader.append(invariant)
+            self.created += 1
+            return invariant
+        if isinstance(node, NodeWhile):
+            # The invariants of a nested loop that do not change in this one either move here
+            for invariant in list(node.preheader):
+                if self.invariant(invariant.expr):
+                    node.preheader.remove(invariant)
+                    preheader.append(invariant)
+        elif isinstance(node, NodeAssign) and not isinstance(node.lval, NodeId):
+            self.hoistOperands(node.lval, preheader)
+        elif isinstance(node, NodeUnaryRefs) and node.op == '&':
+            # The operand of & is an l-value, only its subexpressions may be replaced
+            self.hoistOperands(node.p1, preheader)
+            return node
+        self.hoistOperands(node, preheader)
+        return node
+
+    def hoistOperands(self, node, preheader):
+        if isinstance(node, Node):
+            for slot in nodeSlots(node):
+                if slot not in self.skippedSlots and hasattr(node, slot):
+                    setattr(node, slot, self.hoist(getattr(node, slot), preheader))
+
+
+class NodeFunctionDecl(Node):
+    """Function prototype, or a function definition taken from the function cache."""
+    __slots__ = ('funcType', 'name', 'params', 'line', 'cached', 'used')
+
+    def __init__(self, funcType, name, params, line, cached=None):
+        self.funcType = funcType
+        self.name = name
+        self.params = params
+        self.line = line
+        self.cached = cached
+        self.used = True
+
+    def generate(self):
+        ctx = currentContext()
+        ctx.typeTable[self.name] = [self.funcType, self.params]
+        if self.cached is not None:
+            ctx.functions[self.name] = 0
+            if self.used:
+                ctx.spliceFunction(self.cached)
+        elif self.name in ctx.functions:
+            NodeError('Redeclaration of function ' + self.name + ' is not allowed', self.line)
+        else:
+            if self.name in ctx.EBPoffsetTable:
+                NodeError(self.name + ' is already declared as a variable', self.line)
+            else:
+                ctx.functions[self.name] = 0
+
+
+class NodeFunction(Node):
+    """Function definition, ret is the final return instruction of non void functions.
+
+    used is cleared when nothing reaches the function from main, then only its type is declared.
+    inlinable is set when calls may be replaced by copies of its body. Such a function is
+    parsed even when its code is taken from the function cache, for the copies.
+    warned is set when folding it gave warnings, then it is not cached, so that they are
+    given again, with the lines of the source being compiled.
+    """
+    __slots__ = ('funcType', 'name', 'params', 'body', 'ret', 'line', 'key', 'registerCount', 'frameSize', 'used',
+                 'inlinable', 'warned')
+
+    def __init__(self, funcType, name, params, body, ret, line, key=None):
+        self.funcType = funcType
+        self.name = name
+        self.params = params
+        self.body = body
+        self.ret = ret
+        self.line = line
+        self.key = key
+        self.registerCount = 0
+        self.frameSize = 0
+        self.used = True
+        self.inlinable = False
+        self.warned = False
+
+    def references(self):
+        # The body of a function taken from the cache is not folded, the names its code uses were kept
+        if self.cachedCode() is not None:
+            return set(self.cachedCode().references)
+        return identifiersOf([self.params, self.body, self.ret])
+
+    def fold(self):
+        if self.cachedCode() is not None:
+            return self
+        ctx = currentContext()
+        warnings = len(ctx.warnings)
+        outerPressure = ctx.registerPressure
+        outerNames = ctx.localNames, ctx.addressTaken
+        ctx.registerPressure = 0
+        ctx.frameSize = 0
+        ctx.localNames = {param.lval: () for param in self.params or () if isinstance(param, NodeDeclarationAssign)}
+        ctx.addressTaken = LoopInvariants.addressesTaken([self.body, self.ret])
+        self.body = foldInstructions(self.body)
+        if self.ret is not None:
+            self.ret.fold()
+            if ctx.options.tailCalls and self.tailCallAllowed():
+                self.ret.expr = NodeTailCall(self.ret.expr)
+        self.registerCount = ctx.registerPressure
+        self.frameSize = ctx.frameSize
+        ctx.registerPressure = outerPressure
+        ctx.localNames, ctx.addressTaken = outerNames
+        self.warned = len(ctx.warnings) > warnings
+        return self
+
+    def cachedCode(self):
+        return self.key.cached if isinstance(self.key, FunctionKey) else None
+
+    def tailCallAllowed(self):
+        """Whether the returned call may reuse the frame, that no pointer to a local can outlive."""
+        ctx = currentContext()
+        call = self.ret.expr
+        if not isinstance(call, NodeFunctionCall) or len(call.args) > len(self.params or ()):
+            return False
+        return not any(strides or name in ctx.addressTaken for name, strides in ctx.localNames.items())
+
+    def generate(self):
+        ctx = currentContext()
+        ctx.typeTable[self.name] = [self.funcType, self.params]
+        ctx.functions[self.name] = 0
+        if self.cachedCode() is not None:
+            if self.used:
+                ctx.spliceFunction(self.cachedCode())
+        elif not self.used:
+            # Pruning only leaves the code out, the function is still checked as in a --no-prune build
+            # and its code is cached for the builds that reach it
+            with ctx.discardedCode():
+                self.generateCode(self.key if not self.warned else None)
+        else:
+            self.generateCode(self.key if not self.warned else None)
+
+    def generateCode(self, key):
+        ctx = currentContext()
+        ctx.beginFunction(key, self.references() if ctx.functionCache is not None else (), self.inlinable)
+        entry = None
+        if self.ret is not None and isinstance(self.ret.expr, NodeTailCall) and self.ret.expr.name == self.name:
+            entry = self.ret.expr.entry = 'entry' + str(newLabelID())
+        outerRegisters = ctx.registers
+        ctx.registers = RegisterAllocator(self.registerCount, ctx.stats)
+        NodeFunctionPrologue(self.name, self.frameSize, entry)
+        for instruction in self.body:
+            instruction.generate()
+        if self.ret is not None:
+            self.ret.generate()
+        NodeFunctionEpilogue()
+        ctx.registers = outerRegisters
+        ctx.endFunction()
+
+
 class NodeFunctionPrologue(Node):
-    def __init__(self, name):
+    def __init__(self, name, frameSize=0, entry=None):
+        ctx = currentContext()
         super().WriteLabel(name)
         super().Write('pushl %ebp', "Function Prologue")
         super().Write('movl %esp, %ebp')
+        # The callee saved registers used are saved on top of the frame, locals go below
+        for register in ctx.registers.saved():
+            super().Write('pushl ' + register, "Save " + register)
+        if frameSize:
+            super().Write("subl $" + str(frameSize) + ", %esp", "Reserve space for the locals")
+        # Tail recursive calls jump back here, once the frame is set up
+        if entry is not None:
+            super().WriteLabel(entry)
+        ctx.local_counterEBP = -4 - 4 * len(ctx.registers.saved())
 
         # Create local tables
-        global typeTable, local_EBPoffsetTable, local_typeTable
-        funcArgs = typeTable[name][1]
+        funcArgs = ctx.typeTable[name][1]
 
         local_ParamEBP = 8
-        local_EBPoffsetTable = {}
-        local_typeTable = {}
+        ctx.local_EBPoffsetTable = {}
+        ctx.local_typeTable = {}
         if funcArgs is not None:
-            for arg in reversed(funcArgs):
-                local_EBPoffsetTable[arg.lval] = str(local_ParamEBP)
-                local_typeTable[arg.lval] = arg.nodeType
+            for arg in funcArgs:
+                ctx.local_EBPoffsetTable[arg.lval] = str(local_ParamEBP)
+                ctx.local_typeTable[arg.lval] = arg.nodeType
                 local_ParamEBP += 4
 
 
 class NodeFunctionEpilogue(Node):
     def __init__(self):
-        super().Write('movl %ebp, %esp', "Function Epilogue")
-        super().Write('popl %ebp')
+        ctx = currentContext()
+        self.leaveFrame()
         super().Write('ret\n')
 
         # Reset local tables
-        global local_EBPoffsetTable, local_typeTable, local_counterEBP
+        ctx.local_EBPoffsetTable.clear()
+        ctx.local_typeTable.clear()
 
-        local_EBPoffsetTable.clear()
-        local_typeTable.clear()
+        ctx.local_EBPoffsetTable = None
+        ctx.local_typeTable = None
+        ctx.local_counterEBP = -4
 
-        local_EBPoffsetTable = None
-        local_typeTable = None
-        local_counterEBP = -4
+    @staticmethod
+    def leaveFrame():
+        """Restores the callee saved registers and the frame of the caller."""
+        for index, register in enumerate(currentContext().registers.saved()):
+            Node.Write('movl ' + str(-4 * (index + 1)) + '(%ebp), ' + register, "Restore " + register)
+        Node.Write('movl %ebp, %esp', "Function Epilogue")
+        Node.Write('popl %ebp')
 
 
 class NodeFunctionCall(Node):
-    def __init__(self, name, argc, paramTypes, line):
-
-        global typeTable
-        # Check only for functions that are not printf or scanf
-        if name != 'printf' and name != 'scanf':
-            argTypes = typeTable[name]
-            self.nodeType = argTypes[0]  # Get function return type
-            if paramTypes is not None:
-                argTypes = argTypes[1]  # Get parameters type list
-                if argTypes is None or len(argTypes) != argc:
-                    NodeError("Invalid number of arguments", line)
-                else:
-                    for arg in range(0, len(argTypes)):
-                        if not isinstance(argTypes[arg].nodeType, type(paramTypes[arg].nodeType)):
-                            NodeError("Unexpected types for arguments when calling function " + name, line)
+    __slots__ = ('name', 'args', 'line', 'nodeType')
+    need = 1
+
+    def __init__(self, name, args, line):
+        self.name = name
+        self.args = args
+        self.line = line
+        self.nodeType = None
+
+    def fold(self):
+        self.args = [arg.fold() for arg in self.args]
+        return self
+
+    def generate(self):
+        ctx = currentContext()
+        name, args = self.name, self.args
+        if name not in ctx.functions:
+            raise RuntimeError('line ' + str(self.line) + ': ' + name + ' is not a Function')
+        result = self.callFunction(name, args)
+        self.checkArguments()
+        return result
+
+    def checkArguments(self):
+        ctx = currentContext()
+        name, args = self.name, self.args
+        argTypes = ctx.typeTable[name]
+        self.nodeType = argTypes[0]  # Get function return type
+        if args:
+            argTypes = argTypes[1]  # Get parameters type list
+            if argTypes is None or len(argTypes) != len(args):
+                NodeError("Invalid number of arguments", self.line)
             else:
-                if argTypes[1] is not None:
-                    NodeError("Unexpected types for arguments when calling function " + name, line)
-        super().Write('call ' + name)
+                for arg in range(0, len(argTypes)):
+                    # Prototypes may only give the types of the parameters
+                    paramType = argTypes[arg]
+                    if isinstance(paramType, NodeDeclarationAssign):
+                        paramType = paramType.nodeType
+                    if paramType is not args[arg].nodeType:
+                        NodeError("Unexpected types for arguments when calling function " + name, self.line)
+        else:
+            if argTypes[1] is not None:
+                NodeError("Unexpected types for arguments when calling function " + name, self.line)
+
+    @staticmethod
+    def callFunction(name, args, string=None):
+        """Calls a function, with a string literal before the arguments if given.
+
+        The live caller saved registers are saved around the call. Returns the Temporary
+        holding the result.
+        """
+        ctx = currentContext()
+        registers = ctx.registers
+        saved = registers.save(RegisterAllocator.callerSaved)
+        # Arguments are evaluated and pushed from last to first
+        for arg in reversed(args):
+            operand = arg.generate()
+            Node.Write('pushl ' + str(operand))
+            registers.release(operand)
+        argc = len(args)
+        if string is not None:
+            ctx.strings.append(string)
+            Node.Write('pushl $.s' + str(len(ctx.strings) - 1))
+            argc += 1
+        Node.Write('call ' + name)
         if argc > 0:
-            super().Write('addl $' + str(argc * 4) + ', %esp')
-        super().Write('pushl %eax')
-
-
-class NodeFunctionParam(Node):
-    def __init__(self, arg):
-        # Code writing
-        if isinstance(arg, int):  # cadena
-            super().Write('pushl ' + '$s' + str(arg))
-        elif isinstance(arg, NodeNum):  # literal
-            super().Write('pushl $' + arg.val)
-        elif isinstance(arg, NodeId):  # literal
-            super().Write('pushl ' + arg.val)
-        elif isinstance(arg, NodeFunctionCall) or isinstance(arg, NodeUnaryOp) or isinstance(arg,
-                                                                                             NodeArithmBinOp):  # resultado de función o expresión
-            pass
+            Node.Write('addl $' + str(argc * 4) + ', %esp')
+
+        # The result is in %eax, it is moved if %eax is restored
+        savedRegisters = [temporary.register for temporary in saved]
+        result = registers.allocate(avoid=savedRegisters)
+        if result.register != '%eax':
+            Node.Write('movl %eax, ' + result.register, "Function result")
+        registers.restore(saved)
+        return result
+
+
+class NodeTailCall(NodeFunctionCall):
+    """Call whose value the function returns, made with a jump that reuses the frame.
+
+    The arguments take the place of the parameters of the caller, so there may not be more
+    of them. A call of the function itself jumps to entry, past the prologue, other calls
+    leave the frame first and the callee returns straight to the caller of the function.
+    """
+    __slots__ = ('entry',)
+
+    def __init__(self, call):
+        super().__init__(call.name, call.args, call.line)
+        self.entry = None
+
+    def generate(self):
+        ctx = currentContext()
+        registers = ctx.registers
+        if self.name not in ctx.functions:
+            raise RuntimeError('line ' + str(self.line) + ': ' + self.name + ' is not a Function')
+        # Every argument is evaluated before any parameter is overwritten
+        for arg in reversed(self.args):
+            operand = arg.generate()
+            Node.Write('pushl ' + str(operand))
+            registers.release(operand)
+        for index in range(len(self.args)):
+            Node.Write('popl ' + str(8 + 4 * index) + '(%ebp)', "Tail call argument")
+        self.checkArguments()
+        if self.entry is not None:
+            Node.Write('jmp ' + self.entry, "Tail recursion")
+            ctx.stats['tail recursive calls'] += 1
         else:
-            pass
+            NodeFunctionEpilogue.leaveFrame()
+            Node.Write('jmp ' + self.name, "Tail call")
+            ctx.stats['tail calls'] += 1
+        # The callee leaves its result in %eax
+        return registers.claim('%eax')
+
+
+class NodeInlineCall(Node):
+    """Call replaced by a copy of the body of the function, with its locals renamed.
+
+    params are the renamed parameters, initialized with the arguments of the call, and ret
+    the return expression, whose value is the value of the call.
+    """
+    __slots__ = ('name', 'funcType', 'params', 'body', 'ret', 'line', 'nodeType', 'need')
+
+    def __init__(self, name, funcType, params, body, ret, line):
+        self.name = name
+        self.funcType = funcType
+        self.params = params
+        self.body = body
+        self.ret = ret
+        self.line = line
+        self.nodeType = None
+        self.need = 1
+
+    def fold(self):
+        ctx = currentContext()
+        for param in self.params:
+            param.fold()
+            ctx.frameSize += param.size(param.nodeType)
+            ctx.localNames[param.declaredName()] = ()
+        self.body = foldInstructions(self.body)
+        if self.ret is not None:
+            self.ret = self.ret.fold()
+            if not self.params and not self.body and isinstance(self.ret, NodeNum):
+                return self.ret
+        # The statements of the body run while the operands of the enclosing expression are live
+        self.need = max(subtreeNeed([self.params, self.body, self.ret]), 1)
+        return self
+
+    def generate(self):
+        # Arguments are evaluated from last to first, as they are pushed for a call
+        for param in reversed(self.params):
+            param.generate()
+            if param.rval.nodeType is not param.nodeType:
+                NodeError("Unexpected types for arguments when calling function " + self.name, self.line)
+            param.declare(self.line)
+        for instruction in self.body:
+            instruction.generate()
+        self.nodeType = self.funcType
+        if self.ret is None:
+            return "$0"
+        value = self.ret.generate()
+        # Like the result of a call, the value is never a constant the operators would have folded
+        if isImmediate(value):
+            value = currentContext().registers.load(value, "Inlined return value")
+        return value
 
 
 class NodeReturn(Node):
+    __slots__ = ('expr',)
+
     def __init__(self, exprNode):
-        if isinstance(exprNode, NodeId):
-            super().Write("movl " + exprNode.val + ", %eax", "Move return value")
-        elif isinstance(exprNode, NodeNum):
-            super().Write("movl $" + exprNode.val + ", %eax", "Move return value")
-        else:
-            super().Write("popl %eax", "Pop return value")
+        self.expr = exprNode
+
+    def fold(self):
+        self.expr = self.expr.fold()
+        return self
+
+    def generate(self):
+        registers = currentContext().registers
+        value = self.expr.generate()
+        if not isinstance(value, Temporary) or value.register != '%eax':
+            super().Write("movl " + str(value) + ", %eax", "Move return value")
+        registers.release(value)
+
+
+class Inliner:
+    """Replaces the calls to small functions by copies of their bodies.
+
+    A function is inlined when its body and return expression have at most maxSize nodes, it
+    cannot reach itself through the call graph, and it is defined before the caller, so that
+    its own calls are inlined first. A call is not inlined when the caller has a local named
+    as a global the function uses. The inlined calls of every caller are counted in stats.
+    """
+    # Types are shared by every node, and the names of the locals are renamed on their own
+    sharedNodes = (NodeInt, NodeVoid, NodePointer)
+
+    def __init__(self, maxSize, stats):
+        self.maxSize = maxSize
+        self.stats = stats
+        self.candidates = {}
+        self.caller = None
+        self.callerNames = set()
+        self.copies = 0
+
+    def run(self, body):
+        definitions = {}
+        for instruction in body:
+            if isinstance(instruction, NodeFunction):
+                definitions.setdefault(instruction.name, []).append(instruction)
+        calls = {name: self.calledNames(functions[0]) for name, functions in definitions.items()}
+        for instruction in body:
+            if not isinstance(instruction, NodeFunction):
+                continue
+            self.caller = instruction
+            self.callerNames = self.localNames(instruction)
+            instruction.body = self.inlineCalls(instruction.body)
+            instruction.ret = self.inlineCalls(instruction.ret)
+            name = instruction.name
+            if len(definitions[name]) == 1 and not self.reaches(calls, name, name) and \
+                    all(isinstance(param, NodeDeclarationAssign) for param in instruction.params or ()) and \
+                    self.size([instruction.body, instruction.ret]) <= self.maxSize:
+                instruction.inlinable = True
+                self.candidates[name] = instruction
+
+    @staticmethod
+    def calledNames(node, found=None):
+        if found is None:
+            found = set()
+        if isinstance(node, NodeFunctionCall):
+            found.add(node.name)
+        if isinstance(node, Node):
+            for slot in nodeSlots(node):
+                if slot != 'nodeType':
+                    Inliner.calledNames(getattr(node, slot, None), found)
+        elif isinstance(node, list):
+            for item in node:
+                Inliner.calledNames(item, found)
+        return found
+
+    @staticmethod
+    def reaches(calls, start, target):
+        pending = list(calls.get(start, ()))
+        reached = set()
+        while pending:
+            name = pending.pop()
+            if name == target:
+                return True
+            if name not in reached:
+                reached.add(name)
+                pending.extend(calls.get(name, ()))
+        return False
 
+    @staticmethod
+    def localNames(function):
+        """Names of the parameters and of every local declared in a function."""
+        names = {param.lval for param in function.params or () if isinstance(param, NodeDeclarationAssign)}
+        pending = [function.body, function.ret]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, list):
+                pending.extend(node)
+            elif isinstance(node, Node) and not isinstance(node, Inliner.sharedNodes):
+                if isinstance(node, NodeDeclarationAssign):
+                    names.add(node.declaredName())
+                pending.extend(getattr(node, slot, None) for slot in nodeSlots(node) if slot != 'nodeType')
+        return names
+
+    @staticmethod
+    def variables(node, found=None):
+        """Names of the variables read or written in a subtree."""
+        if found is None:
+            found = set()
+        if isinstance(node, NodeId):
+            found.add(node.idname)
+        elif isinstance(node, list):
+            for item in node:
+                Inliner.variables(item, found)
+        elif isinstance(node, Node) and not isinstance(node, Inliner.sharedNodes):
+            for slot in nodeSlots(node):
+                if slot != 'nodeType':
+                    Inliner.variables(getattr(node, slot, None), found)
+        return found
+
+    def size(self, node):
+        if isinstance(node, list):
+            return sum(self.size(item) for item in node)
+        if not isinstance(node, Node) or isinstance(node, self.sharedNodes):
+            return 0
+        return 1 + sum(self.size(getattr(node, slot, None)) for slot in nodeSlots(node) if slot != 'nodeType')
+
+    def inlineCalls(self, node):
+        """Inlines the calls of a subtree, the arguments first, returns the node that replaces it."""
+        if isinstance(node, list):
+            return [self.inlineCalls(item) for item in node]
+        if not isinstance(node, Node) or isinstance(node, (NodeFunction,) + self.sharedNodes):
+            return node
+        for slot in nodeSlots(node):
+            if slot != 'nodeType' and hasattr(node, slot):
+                setattr(node, slot, self.inlineCalls(getattr(node, slot)))
+        if isinstance(node, NodeFunctionCall):
+            return self.expand(node)
+        return node
+
+    def expand(self, call):
+        callee = self.candidates.get(call.name)
+        if callee is None or len(callee.params or ()) != len(call.args):
+            return call
+        calleeNames = self.localNames(callee)
+        if (self.variables([callee.body, callee.ret]) - calleeNames) & self.callerNames:
+            return call
+        self.copies += 1
+        renamed = {name: name + '.' + str(self.copies) for name in calleeNames}
+        params = [NodeDeclarationAssign(renamed[param.lval], arg, param.nodeType)
+                  for param, arg in zip(callee.params or (), call.args)]
+        ret = self.copy(callee.ret.expr, renamed) if callee.ret is not None else None
+        self.stats['inlined ' + callee.name + ' into ' + self.caller.name] += 1
+        return NodeInlineCall(callee.name, callee.funcType, params, self.copy(callee.body, renamed), ret, call.line)
+
+    def copy(self, node, renamed):
+        """Copy of a subtree with its locals renamed."""
+        if isinstance(node, list):
+            return [self.copy(item, renamed) for item in node]
+        if not isinstance(node, Node) or isinstance(node, self.sharedNodes):
+            return node
+        clone = type(node).__new__(type(node))
+        for slot in nodeSlots(node):
+            if hasattr(node, slot):
+                setattr(clone, slot, self.copy(getattr(node, slot), renamed))
+        if isinstance(clone, NodeId):
+            clone.idname = renamed.get(clone.idname, clone.idname)
+        elif isinstance(clone, NodeDeclarationAssign) and isinstance(clone.lval, str):
+            clone.lval = renamed.get(clone.lval, clone.lval)
+        elif isinstance(clone, NodeArray) and isinstance(clone.refNode, str):
+            clone.refNode = renamed.get(clone.refNode, clone.refNode)
+        return clone
+
+
+class LRTableCache:
+    """Parse tables loaded from disk, with the attributes used by Parser.parse."""
+
+    def __init__(self, tables):
+        self.lr_action = tables['action']
+        self.lr_goto = tables['goto']
+        self.defaulted_states = tables['defaulted']
+
+
+class CachedParserMeta(type(Parser)):
+    """Parser metaclass that keeps the generated LALR tables in an on-disk cache.
+
+    The grammar itself is always rebuilt, as it is cheap and holds the rule functions,
+    but the LALR automaton is only constructed when no cache file matches the hash of
+    the grammar rules, the sly version and the interpreter. The cache directory can be
+    overridden with the PFINAL_CACHE_DIR environment variable.
+    """
+
+    def __new__(meta, clsname, bases, attributes):
+        del attributes['_']
+        cls = type.__new__(meta, clsname, bases, attributes)
+        rules = [(name, value) for name, value in attributes.items() if callable(value) and hasattr(value, 'rules')]
+        if not cls._Parser__validate_specification():
+            raise sly.yacc.YaccError('Invalid parser specification')
+        cls._Parser__build_grammar(rules)
+
+        cachePath = meta.cachePath(cls)
+        try:
+            with open(cachePath, 'rb') as cache:
+                cls._lrtable = LRTableCache(marshal.load(cache))
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            if not cls._Parser__build_lrtables():
+                raise sly.yacc.YaccError('Can\'t build parsing tables')
+            meta.storeTables(cls, cachePath)
+        return cls
+
+    @staticmethod
+    def grammarHash(cls):
+        signature = hashlib.sha256()
+        signature.update(("sly " + sly.__version__ + "\n").encode())
+        signature.update(("python " + sys.version + " marshal " + str(marshal.version) + "\n").encode())
+        signature.update(("start " + str(getattr(cls, 'start', None)) + "\n").encode())
+        signature.update(("precedence " + repr(getattr(cls, 'precedence', None)) + "\n").encode())
+        signature.update(("tokens " + " ".join(sorted(cls.tokens)) + "\n").encode())
+        for production in cls._grammar.Productions:
+            signature.update((str(production) + "\n").encode())
+        return signature.hexdigest()[:20]
+
+    @staticmethod
+    def cacheDir():
+        return os.environ.get('PFINAL_CACHE_DIR',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__'))
+
+    @classmethod
+    def cachePath(meta, cls):
+        return os.path.join(meta.cacheDir(), cls.__name__ + "." + meta.grammarHash(cls) + ".lrtab")
 
-class CParser(Parser):
+    @staticmethod
+    def storeTables(cls, cachePath):
+        tables = {'action': cls._lrtable.lr_action,
+                  'goto': cls._lrtable.lr_goto,
+                  'defaulted': cls._lrtable.defaulted_states}
+        try:
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+            # Drop the tables of older versions of the grammar
+            for stale in glob.glob(os.path.join(os.path.dirname(cachePath), cls.__name__ + ".*.lrtab")):
+                os.remove(stale)
+            fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(cachePath), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as cache:
+                marshal.dump(tables, cache)
+            os.replace(tmpPath, cachePath)
+        except OSError:
+            # The cache is only an optimization, a read-only location is not an error
+            pass
+
+
+class CParser(Parser, metaclass=CachedParserMeta):
     tokens = CLexer.tokens
     start = 'program'
+    # Line numbers are taken from the grammar symbols, so sly does not record the position of every value
+    track_positions = False
 
-    functions = {}
     parser = 0
 
     # Program structure
     @_('sentence')
     def program(self, p):
-        Node.WriteStrings()
+        return NodeProgram(p[0])
 
-    @_('instruction sentence')
+    # Left recursive, so every instruction is reduced into the sentence as soon as it is
+    # complete and the parser stack does not grow with the number of instructions
+    @_('sentence instruction')
     def sentence(self, p):
+        if p[1] is not None:
+            p[0].append(p[1])
         return p[0]
 
     @_('')
     def sentence(self, p):
-        pass
+        return []
 
     @_('type "*"')
     def type(self, p):
-        return NodePointer(p[0])
+        return TYPES.pointer(p[0])
 
     @_('ID "[" expr "]"')
     def var(self, p):
@@ -807,19 +3309,38 @@ class CParser(Parser):
     # Assignations
     @_('type declList ";"')
     def instruction(self, p):
-        for node in reversed(p[1]):
-            node.declare(p.lineno, p[0])
+        return NodeDeclaration(p[0], p[1][::-1], p.lineno)
 
     @_('assignment ";"')
     def instruction(self, p):
-        if not isinstance(p[0], NodeAssign):
-            Node.Write("popl %eax", "Pop unused result")
-        return p[0]
+        return NodeExprStatement(p[0])
 
     @_('var "=" assignment')
     def declaration(self, p):
         return NodeDeclarationAssign(p[0], p[2])
 
+    @_('var "=" "{" initList "}"',
+       'ID "=" "{" initList "}"')
+    def declaration(self, p):
+        return NodeDeclarationAssign(p[0], NodeInitList(p.initList[::-1], p.lineno))
+
+    @_('initItem "," initList')
+    def initList(self, p):
+        p.initList.append(p.initItem)
+        return p.initList  # La lista resultante está al revés
+
+    @_('initItem')
+    def initList(self, p):
+        return [p.initItem]
+
+    @_('expr')
+    def initItem(self, p):
+        return p.expr
+
+    @_('"{" initList "}"')
+    def initItem(self, p):
+        return NodeInitList(p.initList[::-1], p.lineno)
+
     @_('ID "=" assignment')
     def declaration(self, p):
         return NodeDeclarationAssign(p[0], p[2])
@@ -850,86 +3371,42 @@ class CParser(Parser):
         return p[0]
 
     # Structure control
-    @_('IFcondition "{" sentence "}"')
+    @_('IF "(" expr ")" "{" sentence "}"')
     def instruction(self, p):
-        node = p[0]
-        node.falseLabel()
+        return NodeIf(p.expr, p[5])
 
-    @_('IFcondition "{" sentence "}" jumpFinal ELSE "{" sentence "}"')
+    @_('IF "(" expr ")" "{" sentence "}" ELSE "{" sentence "}"')
     def instruction(self, p):
-        node = p[0]
-        node.finalLabel()
+        return NodeIf(p.expr, p[5], p[9])
 
-    @_('')
-    def jumpFinal(self, p):
-        node = p[-4]
-        node.finalJump()
-        node.falseLabel()
-
-    @_('IF "(" expr ")"')
-    def IFcondition(self, p):
-        ID = newLabelID()
-        node = NodeIf(ID)
-        node.compare(p.expr)
-        return node
-
-    @_('WHILEcondition "{" sentence "}"')
+    @_('WHILE "(" expr ")" "{" sentence "}"')
     def instruction(self, p):
-        node = p[0]
-        node.jumpStart()
-        node.finalLabel()
-
-    @_('startWhile WHILE "(" expr ")"')
-    def WHILEcondition(self, p):
-        node = p[0]
-        node.compare()
-        return node
-
-    @_('')
-    def startWhile(self, p):
-        ID = newLabelID()
-        node = NodeWhile(ID)
-        node.startLabel()
-        return node
+        return NodeWhile(p.expr, p.sentence)
 
     # Built-in Functions
     @_('PRINTF "(" STRING "," callParams ")" ";"')
     def instruction(self, p):
-        global strings
-        strings.append(p[2])
-        NodeFunctionParam(len(strings) - 1)
-
-        NodeFunctionCall('printf', len(p[4]) + 1, p[4], p.lineno)
-
-        NodePrint(p.lineno, p.STRING, p.callParams)
+        return NodePrint(p.lineno, p.STRING, p.callParams[::-1])
 
     @_('PRINTF "(" STRING ")" ";" ')
     def instruction(self, p):
-        global strings
-        strings.append(p[2])
-        NodeFunctionParam(len(strings) - 1)
-
-        NodeFunctionCall('printf', 1, None, p.lineno)
-
-        NodePrint(p.lineno, p.STRING)
+        return NodePrint(p.lineno, p.STRING)
 
     @_('SCANF "(" STRING "," scanfParams ")"')
     def num(self, p):
-        global strings
-        strings.append(p[2])
-        NodeFunctionParam(len(strings) - 1)
-
-        node = NodeFunctionCall('scanf', len(p[4]) + 1, None, p.lineno)
-        NodeScan(p.lineno, p.STRING, p.scanfParams)
-        return node
+        return NodeScan(p.lineno, p.STRING, p.scanfParams[::-1])
 
     # User Functions
-    @_('type ID',
-       'VOID ID')
+    @_('type ID')
     def param(self, p):
         node = NodeDeclarationAssign(p[1], None, p[0])
         return node
 
+    @_('VOID ID')
+    def param(self, p):
+        node = NodeDeclarationAssign(p[1], None, TYPES.void)
+        return node
+
     @_('param "," params')
     def params(self, p):
         p[2].append(p[0])
@@ -950,127 +3427,80 @@ class CParser(Parser):
 
     @_('expr "," callParams')
     def callParams(self, p):
-        NodeFunctionParam(p[0])
         p.callParams.append(p[0])
-        return p.callParams
+        return p.callParams  # La lista resultante está al revés
 
     @_('expr')
     def callParams(self, p):
-        NodeFunctionParam(p[0])
         return [p[0]]
 
     @_('expr "," scanfParams')
     def scanfParams(self, p):
-        NodeFunctionParam(p[0])
-        p[2].append(p.address)
-        return p[2]
+        p[2].append(p[0])
+        return p[2]  # La lista resultante está al revés
 
     @_('expr')
     def scanfParams(self, p):
-        NodeFunctionParam(p[0])
         return [p[0]]
 
     @_('ID "(" callParams ")"')
     def num(self, p):
-        if p[0] in self.functions:
-            return NodeFunctionCall(p[0], len(p[2]), p[2], p.lineno)
-        else:
-            raise RuntimeError('line ' + str(p.lineno) + ': ' + p[0] + ' is not a Function')
+        return NodeFunctionCall(p[0], p[2][::-1], p.lineno)
 
     @_('ID "(" ")"')
     def num(self, p):
-        if p[0] in self.functions:
-            return NodeFunctionCall(p[0], 0, None, p.lineno)
-        else:
-            raise RuntimeError('line ' + str(p.lineno) + ': ' + p[0] + ' is not a Function')
+        return NodeFunctionCall(p[0], [], p.lineno)
 
     @_('RETURN expr ";"')
     def retInstruction(self, p):
-        NodeReturn(p[1])
-        return
+        return NodeReturn(p[1])
 
+    # Headers are (type, name, parameters in order, line)
     @_('type ID "(" params ")"',
        'type ID "(" typeDec ")"')
     def functionDecl(self, p):
-        global typeTable
-        typeTable[p[1]] = [p[0], p[3]]
-        return p[1]
+        return p[0], p[1], p[3][::-1], p.lineno
 
     @_('type ID "(" ")"')
     def functionDecl(self, p):
-        global typeTable
-        typeTable[p[1]] = [p[0], None]
-        return p[1]
+        return p[0], p[1], None, p.lineno
 
     @_('VOID ID "(" params ")"',
        'VOID ID "(" typeDec ")"')
     def voidFunctionDecl(self, p):
-        global typeTable
-        typeTable[p[1]] = [p[0], p[3]]
-        return p[1]
+        return TYPES.void, p[1], p[3][::-1], p.lineno
 
     @_('VOID ID "(" ")"')
     def voidFunctionDecl(self, p):
-        global typeTable
-        typeTable[p[1]] = [p[0], None]
-        return p[1]
+        return TYPES.void, p[1], None, p.lineno
 
     @_('functionDecl ";"',
        'voidFunctionDecl ";"')
     def instruction(self, p):
-        if p[0] in self.functions:
-            NodeError('Redeclaration of function ' + p[0] + ' is not allowed', p.lineno)
-        else:
-            if p[0] in EBPoffsetTable:
-                NodeError(p[0] + ' is already declared as a variable', p.lineno)
-            else:
-                self.functions[p[0]] = 0
-        return 0
-
-    @_('functionDecl "{"')
-    def functDefInit(self, p):
-        self.functions[p[0]] = 0
-        NodeFunctionPrologue(p[0])
-        return 0
-
-    @_('voidFunctionDecl "{"')
-    def voidfunctDefInit(self, p):
-        self.functions[p[0]] = 0
-        NodeFunctionPrologue(p[0])
-        return 0
+        funcType, name, params, line = p[0]
+        # The ";" of a definition taken from the function cache carries its CachedFunction
+        cached = p[1] if isinstance(p[1], CachedFunction) else None
+        return NodeFunctionDecl(funcType, name, params, line, cached)
 
-    @_('functDefInit sentence retInstruction "}"')
+    # The "{" of a definition carries its FunctionKey when the function cache is used
+    @_('functionDecl "{" sentence retInstruction "}"')
     def instruction(self, p):
-        NodeFunctionEpilogue()
-        return 0
+        funcType, name, params, line = p[0]
+        return NodeFunction(funcType, name, params, p.sentence, p.retInstruction, line, p[1])
 
-    @_('voidfunctDefInit sentence "}"')
+    @_('voidFunctionDecl "{" sentence "}"')
     def instruction(self, p):
-        NodeFunctionEpilogue()
-        return 0
+        funcType, name, params, line = p[0]
+        return NodeFunction(funcType, name, params, p.sentence, None, line, p[1])
 
     # Logical operators
-    @_('logicalOR LOGICOR')
-    def logicalORFirst(self, p):
-        node = NodeLogical('||')
-        node.firstOperand(p[0])
-        return node
-
-    @_('logicalORFirst logicalAND')
+    @_('logicalOR LOGICOR logicalAND')
     def logicalOR(self, p):
-        p[0].secondOperand(p[1])
-        return p[0]
+        return NodeLogical('||', p[0], p[2])
 
-    @_('logicalAND LOGICAND')
-    def logicalANDFirst(self, p):
-        node = NodeLogical('&&')
-        node.firstOperand(p[0])
-        return node
-
-    @_('logicalANDFirst comparison')
+    @_('logicalAND LOGICAND comparison')
     def logicalAND(self, p):
-        p[0].secondOperand(p[1])
-        return p[0]
+        return NodeLogical('&&', p[0], p[2])
 
     # Relational Operations
     @_('comparison EQUAL relation')
@@ -1149,11 +3579,11 @@ class CParser(Parser):
     # PlaceHolder type function for scalability with more types
     @_('INT')
     def type(self, p):
-        return NodeInt()
+        return TYPES.int
 
     @_('INTVALUE')
     def num(self, p):
-        return NodeNum(p[0], NodeInt(), p.lineno)
+        return NodeNum(p[0], TYPES.int, p.lineno)
 
     @_('ID')
     def num(self, p):
@@ -1203,35 +3633,662 @@ class CParser(Parser):
     def error(self, p):
         if p:
             print(bcolors.BOLD, bcolors.OKCYAN, "Syntax error at token", p.type, ", line: ", p.lineno)
+            currentContext().syntaxErrors.append("Syntax error at token " + p.type + ", line: " + str(p.lineno))
             # Just discard the token and tell the parser it's okay.
             # self.errok()
         else:
             print("Syntax error at EOF, check for any missing semicolon")
+            currentContext().syntaxErrors.append("Syntax error at EOF, check for any missing semicolon")
+
+
+# Function cache
+# Keeps the assembly of every function definition on disk, addressed by a hash of the
+# tokens of the definition, of the top-level declarations of the symbols it refers to
+# and of the compiler itself. Before parsing, a cached definition is replaced by its
+# prototype, whose ";" token carries the CachedFunction that is spliced in its place.
+# The "{" token of the other definitions carries their FunctionKey, so that their code
+# is captured and stored once the compilation succeeds. Label numbers and string
+# literals are stored relative to the function, and renumbered when it is spliced.
+class FunctionKey(str):
+    """Cache key of a function definition, carried as the value of its "{" token.
+
+    cached is the cache entry of a function that may be inlined, which is parsed for the
+    copies of its body but whose own code comes from the cache.
+    """
+    cached = None
+
+
+class CachedFunction:
+    """Cache entry of a function definition, carried as the value of a ";" token."""
+
+    labelRe = re.compile('\x00([0-9]+)\x00')
+    stringRe = re.compile('\x01([0-9]+)\x01')
+
+    def __init__(self, entry):
+        self.text = entry['text']
+        self.labels = entry['labels']
+        self.strings = entry['strings']
+        self.references = entry['references']
+        self.inlinable = entry.get('inlinable', False)
+
+    def expand(self, labelBase, stringBase):
+        text = self.labelRe.sub(lambda m: str(labelBase + int(m.group(1))), self.text)
+        return self.stringRe.sub(lambda m: str(stringBase + int(m.group(1))), text)
+
+
+class FunctionCapture:
+    """Function definition being compiled, whose code is captured for the cache."""
+
+    def __init__(self, key, labelBase, stringBase, references=(), inlinable=False):
+        self.key = key
+        self.labelBase = labelBase
+        self.stringBase = stringBase
+        self.references = sorted(references)
+        self.inlinable = inlinable
+        self.depth = 0
+
+
+class FunctionCache:
+    """On-disk cache of the assembly generated for each function definition.
+
+    Every entry is a file whose modification time records its last use. When the
+    entries grow beyond maxBytes, the least recently used ones are evicted. A cache
+    directory can be shared by several threads and processes.
+    """
+
+    defaultMaxBytes = 64 * 1024 * 1024
+    # Labels defined in a function and jumps to them, the function label itself excluded
+    labelRe = re.compile(r'^([A-Za-z_]+)([0-9]+)(?=:$)|^(\tj[a-z]+ )([A-Za-z_]+)([0-9]+)\b', re.M)
+    definedLabelRe = re.compile(r'^([A-Za-z_]+[0-9]+):$', re.M)
+    stringRe = re.compile(r'\$\.s([0-9]+)\b')
+    fingerprint = None
+
+    def __init__(self, directory, maxBytes=None):
+        self.directory = directory
+        self.maxBytes = maxBytes if maxBytes is not None else self.defaultMaxBytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def compilerFingerprint(cls):
+        if cls.fingerprint is None:
+            with open(os.path.abspath(__file__), 'rb') as source:
+                cls.fingerprint = hashlib.sha256(source.read()).hexdigest()
+        return cls.fingerprint
+
+    @staticmethod
+    def topLevelStatements(tokens):
+        """Splits a token list into its top-level statements and function definitions."""
+        statement = []
+        depth = 0
+        # The braces of an initializer list do not end the declaration
+        initializer = False
+        for tok in tokens:
+            statement.append(tok)
+            if tok.type == '{':
+                depth += 1
+            elif tok.type == '}':
+                depth -= 1
+                if depth <= 0 and not initializer:
+                    depth = 0
+                    yield statement
+                    statement = []
+            elif tok.type == '=' and depth == 0:
+                initializer = True
+            elif tok.type == ';' and depth == 0:
+                yield statement
+                statement = []
+                initializer = False
+        if statement:
+            yield statement
+
+    @staticmethod
+    def declaredFunction(statement):
+        """Name and header length of a function prototype or definition, or (None, 0)."""
+        if statement[0].type not in ('INT', 'VOID'):
+            return None, 0
+        i = 1
+        while i < len(statement) and statement[i].type == '*':
+            i += 1
+        if i + 1 >= len(statement) or statement[i].type != 'ID' or statement[i + 1].type != '(':
+            return None, 0
+        for end in range(i + 2, len(statement)):
+            if statement[end].type in ('{', ';'):
+                return (statement[i].value, end) if statement[end - 1].type == ')' else (None, 0)
+        return None, 0
+
+    @staticmethod
+    def signature(statement):
+        return '\x1f'.join(tok.type + ' ' + str(tok.value) for tok in statement)
+
+    def plan(self, tokens, options='', inlining=False):
+        """Replaces the cached function definitions of a token list by their prototypes.
+
+        options is the signature of the compiler options, which is part of every key. When
+        inlining, the code of a function may hold copies of the functions defined before it,
+        so the keys of those definitions take the place of their declarations in its key.
+        """
+        planned = []
+        declarations = {}
+        for statement in self.topLevelStatements(tokens):
+            name, headerEnd = self.declaredFunction(statement)
+            dependency = None
+            if name is not None and statement[headerEnd].type == '{':
+                key = hashlib.sha256((self.compilerFingerprint() + options).encode())
+                key.update(self.signature(statement).encode())
+                for symbol in sorted({tok.value for tok in statement if tok.type == 'ID'}):
+                    for declaration in declarations.get(symbol, ()):
+                        key.update(('\x00' + symbol + '\x00' + declaration).encode())
+                key = FunctionKey(key.hexdigest())
+                if inlining:
+                    dependency = str(key)
+                entry = self.load(key)
+                if entry is not None and inlining and entry.get('inlinable'):
+                    # The body is still parsed, to be copied into the callers
+                    key.cached = CachedFunction(entry)
+                    statement[headerEnd].value = key
+                    planned.extend(statement)
+                elif entry is not None:
+                    semicolon = statement[headerEnd]
+                    semicolon.type = ';'
+                    semicolon.value = CachedFunction(entry)
+                    planned.extend(statement[:headerEnd + 1])
+                else:
+                    statement[headerEnd].value = key
+                    planned.extend(statement)
+            else:
+                planned.extend(statement)
+
+            # Remember the declarations of global symbols, for the functions that follow
+            if name is not None:
+                declarations.setdefault(name, []).append(dependency or self.signature(statement[:headerEnd]))
+            elif statement[0].type == 'INT':
+                declaration = self.signature(statement)
+                for symbol in {tok.value for tok in statement if tok.type == 'ID'}:
+                    declarations.setdefault(symbol, []).append(declaration)
+        return planned
+
+    @classmethod
+    def makeEntry(cls, text, labelBase, labelCount, stringBase, strings, references=(), inlinable=False):
+        """Cache entry of the code of a function, or None if its labels are not understood."""
+        functionLabel, newline, body = text.partition('\n')
+        valid = True
+        # Tail calls jump to other functions, whose labels are kept
+        local = set(cls.definedLabelRe.findall(body))
+
+        def relativeLabel(m):
+            nonlocal valid
+            if m.group(3) and m.group(4) + m.group(5) not in local:
+                return m.group(0)
+            prefix = m.group(1) or m.group(3) + m.group(4)
+            number = int(m.group(2) or m.group(5))
+            if not labelBase < number <= labelBase + labelCount:
+                valid = False
+            return prefix + '\x00' + str(number - labelBase) + '\x00'
+
+        def relativeString(m):
+            nonlocal valid
+            number = int(m.group(1))
+            if number < stringBase:
+                valid = False
+            return '$.s\x01' + str(number - stringBase) + '\x01'
+
+        body = cls.stringRe.sub(relativeString, cls.labelRe.sub(relativeLabel, body))
+        if not valid:
+            return None
+        return {'text': functionLabel + newline + body, 'labels': labelCount, 'strings': strings,
+                'references': list(references), 'inlinable': inlinable}
+
+    def entryPath(self, key):
+        return os.path.join(self.directory, key + ".fn")
+
+    def load(self, key):
+        path = self.entryPath(key)
+        try:
+            with open(path) as cached:
+                entry = json.load(cached)
+            # Record the use for the LRU eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            entry = None
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def store(self, key, entry):
+        try:
+            fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as cached:
+                json.dump(entry, cached)
+            os.replace(tmpPath, self.entryPath(key))
+        except OSError:
+            # The cache is only an optimization, a read-only location is not an error
+            return
+        with self.lock:
+            self.stores += 1
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in maxBytes."""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as scan:
+                for dirEntry in scan:
+                    if dirEntry.name.endswith('.fn'):
+                        st = dirEntry.stat()
+                        entries.append((st.st_mtime_ns, st.st_size, dirEntry.path))
+                        total += st.st_size
+        except OSError:
+            return
+        if total <= self.maxBytes:
+            return
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions}
+
+    def addStats(self, stats):
+        with self.lock:
+            self.hits += stats['hits']
+            self.misses += stats['misses']
+            self.stores += stats['stores']
+            self.evictions += stats['evictions']
+
+
+def compile_source(text, filename="OutputFinal.s", lexer=None, parser=None, functionCache=None, options=None,
+                   warnings=None):
+    """Compiles C source text and returns the generated assembly, without using the disk.
+
+    filename is only used for the .file directive. Compilation errors are raised as
+    RuntimeError. A lexer and parser can be given to reuse them between compilations,
+    a FunctionCache to reuse the code of the unchanged function definitions, and
+    CompilerOptions to select the optimization passes. The warnings are appended to the
+    warnings list if given, also when the compilation fails.
+    """
+    lexer = lexer if lexer is not None else CLexer()
+    parser = parser if parser is not None else CParser()
+    context = CompilationContext(MemoryEmitter(filename), functionCache, options)
+    try:
+        context.compile(parser, lexer.tokenizeFast(text))
+    finally:
+        if warnings is not None:
+            warnings.extend(context.warnings)
+    return context.emitter.output
+
+
+def compile_file(sourceFilename, outputFilename, spool=False, lexer=None, parser=None, functionCache=None,
+                 options=None):
+    """Compiles a C file into an assembly file, spooling the sections to disk if asked.
+
+    A lexer and parser can be given to reuse them between compilations, a FunctionCache
+    to reuse the code of the unchanged function definitions, and CompilerOptions to
+    select the optimization passes. Returns the CompilationContext, with the counters of
+    the optimization passes in its stats and the warnings in its warnings.
+    """
+    emitter = SpoolEmitter(outputFilename) if spool else Emitter(outputFilename)
+    open(outputFilename, 'w').close()
+    lexer = lexer if lexer is not None else CLexer()
+    parser = parser if parser is not None else CParser()
+    context = CompilationContext(emitter, functionCache, options)
+    context.compile(parser, lexer.tokenizeFile(sourceFilename))
+    return context
+
+
+# Batch compilation
+# Every worker process builds its lexer and parser once and reuses them for all the
+# files it is given. Jobs are mapped in order, so the report does not depend on the
+# number of workers.
+workerLexer = None
+workerParser = None
+workerFunctionCache = None
+
+
+def initBatchWorker():
+    global workerLexer, workerParser
+    workerLexer = CLexer()
+    workerParser = CParser()
+
+
+def workerCache(cacheSettings):
+    """FunctionCache of the worker for the (directory, maxBytes) settings of a job."""
+    global workerFunctionCache
+    if cacheSettings is None:
+        return None
+    if workerFunctionCache is None or (workerFunctionCache.directory, workerFunctionCache.maxBytes) != cacheSettings:
+        workerFunctionCache = FunctionCache(*cacheSettings)
+    return workerFunctionCache
+
+
+def compileBatchJob(job):
+    """Compiles one (source, output, spool, cache settings, options) job.
+
+    Returns (source, output, error or None, function cache counters of the job or None,
+    counters of the optimization passes, warnings).
+    """
+    sourceFilename, outputFilename, spool, cacheSettings, options = job
+    if workerParser is None:
+        initBatchWorker()
+    functionCache = workerCache(cacheSettings)
+    before = functionCache.stats() if functionCache is not None else None
+    messages = io.StringIO()
+    stats = collections.Counter()
+    warnings = []
+    try:
+        with contextlib.redirect_stdout(messages):
+            context = compile_file(sourceFilename, outputFilename, spool, workerLexer, workerParser, functionCache,
+                                   options)
+        stats, warnings = context.stats, context.warnings
+        error = None
+    except Exception as e:
+        error = str(e) if isinstance(e, RuntimeError) else type(e).__name__ + ": " + str(e)
+        details = messages.getvalue().strip()
+        error = details + "\n" + error if details else error
+    cacheStats = None
+    if functionCache is not None:
+        cacheStats = {name: value - before[name] for name, value in functionCache.stats().items()}
+    return sourceFilename, outputFilename, error, cacheStats, stats, warnings
+
+
+def collectSources(paths):
+    """Expands the given files and directories (searched recursively) into C source files."""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                sources.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.c'))
+        else:
+            sources.append(path)
+    return sources
+
+
+def compile_batch(sources, outputDir=None, jobs=None, spool=False, functionCache=None, options=None, stats=None):
+    """Compiles many C files on a pool of worker processes.
+
+    Every source.c is compiled to source.s, next to it or inside outputDir, where the sources
+    keep their paths relative to the directory they all share. Returns the list of
+    (source, output, error or None, warnings) in the order of sources. The workers share
+    the directory of functionCache, whose counters receive the ones of every job, and
+    the counters of the optimization passes are added to the stats Counter if given.
+    """
+    cacheSettings = (functionCache.directory, functionCache.maxBytes) if functionCache is not None else None
+    batch = []
+    if outputDir is not None and sources:
+        commonRoot = os.path.commonpath([os.path.dirname(os.path.abspath(source)) for source in sources])
+    outputs = {}
+    for sourceFilename in sources:
+        outputFilename = os.path.splitext(sourceFilename)[0] + ".s"
+        if outputDir is not None:
+            relative = os.path.relpath(os.path.abspath(outputFilename), commonRoot)
+            outputFilename = os.path.join(outputDir, relative)
+        # Two jobs writing the same file would leave only one of them
+        key = os.path.abspath(outputFilename)
+        if key in outputs:
+            raise RuntimeError(outputs[key] + " and " + sourceFilename + " would both be compiled to " +
+                               outputFilename)
+        outputs[key] = sourceFilename
+        batch.append((sourceFilename, outputFilename, spool, cacheSettings, options))
+    for directory in {os.path.dirname(job[1]) for job in batch} if outputDir is not None else ():
+        os.makedirs(directory or '.', exist_ok=True)
+
+    jobs = jobs if jobs is not None else os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(batch)))
+    if jobs == 1:
+        results = [compileBatchJob(job) for job in batch]
+    else:
+        chunkSize = max(1, len(batch) // (jobs * 8))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=initBatchWorker) as pool:
+            results = list(pool.map(compileBatchJob, batch, chunksize=chunkSize))
+    for result in results:
+        if functionCache is not None:
+            functionCache.addStats(result[3])
+        if stats is not None:
+            stats.update(result[4])
+    return [result[:3] + result[5:] for result in results]
+
+
+# Compile daemon
+# Keeps the compiler warm in a long-running process and serves compile requests over a
+# Unix domain socket. The protocol is one JSON object per line in both directions:
+#   {"op": "compile", "source": "...", "filename": "out.s"} -> {"ok": true, "assembly": "...", "warnings": [...]}
+#                                                           -> {"ok": false, "error": "...", "warnings": [...]}
+#   {"op": "stats"}                                         -> {"ok": true, "stats": {...}}
+#   {"op": "shutdown"}                                      -> {"ok": true}
+# A connection may carry any number of requests. Connections are served by their own
+# thread and every compilation gets its own CompilationContext.
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {'ok': False, 'error': "Invalid request: " + str(e)}
+            else:
+                response = self.server.dispatch(request)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class CompileDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    latencyWindow = 10000
+
+    def __init__(self, socketPath, functionCache=None, options=None):
+        self.socketPath = socketPath
+        # Identity of the socket file this daemon bound, the only one it removes
+        self.socketFile = None
+        self.removeStaleSocket(socketPath)
+        super().__init__(socketPath, CompileRequestHandler)
+        self.functionCache = functionCache
+        self.options = options
+        self.workers = threading.local()
+        self.statsLock = threading.Lock()
+        self.latencies = collections.deque(maxlen=self.latencyWindow)
+        self.compiled = 0
+        self.failed = 0
+
+    def dispatch(self, request):
+        op = request.get('op') if isinstance(request, dict) else None
+        if op == 'compile':
+            return self.compile(request)
+        elif op == 'stats':
+            return {'ok': True, 'stats': self.stats()}
+        elif op == 'shutdown':
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {'ok': True}
+        return {'ok': False, 'error': "Unknown operation " + repr(op)}
+
+    def compile(self, request):
+        start = time.perf_counter()
+        if not hasattr(self.workers, 'parser'):
+            self.workers.lexer = CLexer()
+            self.workers.parser = CParser()
+        warnings = []
+        try:
+            assembly = compile_source(request.get('source', ''), request.get('filename', "OutputFinal.s"),
+                                      self.workers.lexer, self.workers.parser, self.functionCache, self.options,
+                                      warnings)
+            response = {'ok': True, 'assembly': assembly, 'warnings': warnings}
+        except Exception as e:
+            error = str(e) if isinstance(e, RuntimeError) else type(e).__name__ + ": " + str(e)
+            response = {'ok': False, 'error': error, 'warnings': warnings}
+        elapsed = time.perf_counter() - start
+        with self.statsLock:
+            self.latencies.append(elapsed)
+            if response['ok']:
+                self.compiled += 1
+            else:
+                self.failed += 1
+        return response
+
+    def stats(self):
+        """Request counters and compile latency statistics, in ms, over the latest requests."""
+        with self.statsLock:
+            latencies = sorted(self.latencies)
+            stats = {'compiled': self.compiled, 'failed': self.failed, 'window': len(latencies)}
+        if self.functionCache is not None:
+            stats.update(('cache_' + name, value) for name, value in self.functionCache.stats().items())
+        if latencies:
+            def percentile(fraction):
+                return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+            stats.update(mean_ms=sum(latencies) / len(latencies) * 1000, p50_ms=percentile(0.5),
+                         p90_ms=percentile(0.9), p99_ms=percentile(0.99), max_ms=latencies[-1] * 1000)
+        return stats
+
+    @staticmethod
+    def removeStaleSocket(socketPath):
+        """Removes the socket left by a daemon that is no longer running, refuses any other file."""
+        try:
+            mode = os.lstat(socketPath).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise RuntimeError(socketPath + " already exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socketPath)
+            except ConnectionRefusedError:
+                os.unlink(socketPath)
+                return
+        raise RuntimeError("Address " + socketPath + " is in use by a running daemon")
+
+    def server_bind(self):
+        super().server_bind()
+        info = os.lstat(self.socketPath)
+        self.socketFile = (info.st_dev, info.st_ino)
+
+    def server_close(self):
+        super().server_close()
+        if self.socketFile is None:
+            return
+        try:
+            info = os.lstat(self.socketPath)
+            if (info.st_dev, info.st_ino) == self.socketFile:
+                os.unlink(self.socketPath)
+        except FileNotFoundError:
+            pass
+        self.socketFile = None
+
+
+def run_daemon(socketPath, functionCache=None, options=None):
+    with CompileDaemon(socketPath, functionCache, options) as daemon:
+        print("Compile daemon listening on " + socketPath)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
 
 
 if __name__ == '__main__':
-    EBPoffsetTable = {}
-    typeTable = {}
-    local_typeTable = None
-    local_EBPoffsetTable = None
-    counterEBP = -4
-    local_counterEBP = -4
-    counterString = 0
-    strings = []
-    lexer = CLexer()
-    parser = CParser()
-    Node.outputFilename = "OutputFinal.s"
-    open(Node.outputFilename, 'w').close()
-
-    text = open("SourceFinal.c").read()
-    tokenizedText = lexer.tokenize(text)
-    # print("\n =========[ Lexer ] ===========")
-    # for token in tokenizedText:
-    # print("token:", token.type, ", lexvalue:", token.value)
+    argParser = argparse.ArgumentParser(description="Compiles SourceFinal.c into OutputFinal.s, or every given "
+                                                    "C file or directory into its own .s file")
+    argParser.add_argument('sources', nargs='*',
+                           help="C files or directories to compile in batch, each source.c gives source.s")
+    argParser.add_argument('-o', '--output-dir', help="directory for the batch outputs, next to the sources by "
+                                                      "default")
+    argParser.add_argument('-j', '--jobs', type=int, default=None,
+                           help="number of worker processes for batch compilation, one per core by default")
+    argParser.add_argument('--spool', action='store_true',
+                           help="spool the generated sections to temporary files to keep memory use flat")
+    argParser.add_argument('--daemon', metavar='SOCKET',
+                           help="run as a compile daemon on the given Unix socket, see PClient.py")
+    argParser.add_argument('--function-cache', metavar='DIR',
+                           help="reuse the assembly of unchanged function definitions cached in DIR")
+    argParser.add_argument('--function-cache-size', metavar='MB', type=float,
+                           default=FunctionCache.defaultMaxBytes / (1024 * 1024),
+                           help="size of the function cache, least recently used entries are evicted beyond it "
+                                "(default %(default)g)")
+    argParser.add_argument('--no-peephole', action='store_true',
+                           help="do not run the peephole optimizer over the generated instructions")
+    argParser.add_argument('--no-dead-code', action='store_true',
+                           help="do not remove unreachable code, dead stores and unused values of the functions")
+    argParser.add_argument('--no-prune', action='store_true',
+                           help="keep the functions main does not reach and the unused globals and strings")
+    argParser.add_argument('--no-licm', action='store_true',
+                           help="do not move the loop invariant expressions out of the while loops")
+    argParser.add_argument('--no-tail-calls', action='store_true',
+                           help="make returned calls with call instructions instead of jumps")
+    argParser.add_argument('--inline-size', metavar='NODES', type=int, default=30,
+                           help="inline the calls to functions of at most NODES nodes, 0 turns it off "
+                                "(default %(default)d)")
+    argParser.add_argument('--report', action='store_true',
+                           help="print the counters of the optimization passes")
+    args = argParser.parse_args()
+
+    options = CompilerOptions(peephole=not args.no_peephole, deadCode=not args.no_dead_code, prune=not args.no_prune,
+                              licm=not args.no_licm, inlineSize=args.inline_size, tailCalls=not args.no_tail_calls)
+    stats = collections.Counter()
+
+    functionCache = None
+    if args.function_cache:
+        functionCache = FunctionCache(args.function_cache, int(args.function_cache_size * 1024 * 1024))
+
+    def printCacheStats():
+        if functionCache is not None:
+            print("Function cache: %(hits)d hits, %(misses)d misses, %(stores)d stored, %(evictions)d evicted"
+                  % functionCache.stats())
+
+    def printReport():
+        if args.report:
+            for name, value in sorted(stats.items()):
+                print("%-32s %d" % (name, value))
+
+    if args.daemon:
+        try:
+            run_daemon(args.daemon, functionCache, options)
+        except RuntimeError as e:
+            print("ERROR " + str(e))
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.sources:
+        try:
+            results = compile_batch(collectSources(args.sources), args.output_dir, args.jobs, args.spool,
+                                    functionCache, options, stats)
+        except RuntimeError as e:
+            print("ERROR " + str(e))
+            sys.exit(1)
+        failed = 0
+        for sourceFilename, outputFilename, error, warnings in results:
+            if error is None:
+                print("OK    " + sourceFilename + " -> " + outputFilename)
+                for warning in warnings:
+                    print("WARNING " + sourceFilename + ": " + warning)
+            else:
+                failed += 1
+                print("ERROR " + sourceFilename + ": " + error)
+        print(str(len(results) - failed) + " compiled, " + str(failed) + " failed")
+        printCacheStats()
+        printReport()
+        sys.exit(1 if failed else 0)
 
     print("\n =========[ Parser ] ============")
     try:
-        parser.parse(lexer.tokenize(text))
+        stats = compile_file("SourceFinal.c", "OutputFinal.s", args.spool, functionCache=functionCache,
+                             options=options).stats
         print("========== [ Fin ]===============")
+        printCacheStats()
+        printReport()
     except RuntimeError as e:
         print(e)
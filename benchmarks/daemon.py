@@ -0,0 +1,68 @@
+"""Measures the round trip time of compile requests sent to the compile daemon.
+
+A daemon is started on a temporary socket, SourceFinal.c is compiled through it
+repeatedly over one connection, and both the client round trip times and the latency
+statistics reported by the daemon are printed.
+
+Usage: python benchmarks/daemon.py [--requests N] [--source FILE]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from PClient import DaemonConnection  # noqa: E402
+
+
+def waitForSocket(socketPath, daemon, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socketPath):
+        if daemon.poll() is not None or time.monotonic() > deadline:
+            sys.exit("The compile daemon did not start")
+        time.sleep(0.01)
+
+
+def main():
+    argParser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argParser.add_argument('--requests', type=int, default=200, help="number of compile requests")
+    argParser.add_argument('--source', default=os.path.join(REPO_DIR, "SourceFinal.c"), help="C file to compile")
+    args = argParser.parse_args()
+
+    with open(args.source) as source:
+        text = source.read()
+    with tempfile.TemporaryDirectory() as tmpDir:
+        socketPath = os.path.join(tmpDir, "pfinal.sock")
+        daemon = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "PFinal.py"), "--daemon", socketPath],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            waitForSocket(socketPath, daemon)
+            with DaemonConnection(socketPath) as connection:
+                roundTrips = []
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    response = connection.compile(text)
+                    roundTrips.append((time.perf_counter() - start) * 1000)
+                    if not response['ok']:
+                        sys.exit("Compilation failed: " + response['error'])
+                daemonStats = connection.request({'op': 'stats'})['stats']
+                connection.request({'op': 'shutdown'})
+            daemon.wait(timeout=10)
+        finally:
+            if daemon.poll() is None:
+                daemon.kill()
+
+    roundTrips.sort()
+    print("client round trip over %d requests: median %.2f ms, p90 %.2f ms, max %.2f ms" % (
+        len(roundTrips), statistics.median(roundTrips), roundTrips[int(0.9 * len(roundTrips))], roundTrips[-1]))
+    print("daemon compile latency: mean %.2f ms, p50 %.2f ms, p99 %.2f ms" % (
+        daemonStats['mean_ms'], daemonStats['p50_ms'], daemonStats['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Compares the throughput of the CLexer engines on a generated multi-megabyte source.
+
+Engines measured:
+  legacy   sly tokenize with the former greedy STRING and block comment regexes
+  sly      sly tokenize with the current CLexer rules
+  fast     CLexer.tokenizeFast, one sly Token per lexeme
+  compact  CLexer.tokenizeCompact, parallel arrays of type codes, offsets and lines
+
+The fast and compact streams are checked against the sly one before timing, and the
+fast engine on bytes against the one on text for a source with non-ASCII characters.
+
+Usage: python benchmarks/lexer.py [--size MB] [--runs N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PFinal import CLexer  # noqa: E402
+
+
+class LegacyCLexer(CLexer):
+    tokens = CLexer.tokens
+
+    @_(r'".*"')
+    def STRING(self, t):
+        t.value = t.value[1:-1]
+        return t
+
+    @_(r'/\*(.|\n)*\*/')
+    def ignore_commentBlock(self, t):
+        self.lineno += t.value.count('\n')
+
+
+FUNCTION = '''/* Function number %(n)d
+   returns a combination of its parameters */
+int f%(n)d(int x, int y){
+    int r = x * %(n)d + y;    // first step
+    if (r >= 100 && x != y || !y) {
+        printf("f%(n)d: x=%%d y=%%d, a long message to make the string literal wide %(pad)s", x, y);
+    }
+    while (r > 0) {
+        r = r - y / 2 %% 3;
+    }
+    return r;
+}
+'''
+
+
+def generateSource(size):
+    parts = []
+    total = 0
+    n = 0
+    while total < size:
+        part = FUNCTION % {'n': n, 'pad': 'x' * (n % 200)}
+        parts.append(part)
+        total += len(part)
+        n += 1
+    return ''.join(parts)
+
+
+# Non-ASCII characters in a string, in comments, and illegal ones outside of them
+NON_ASCII = '''/* caf\u00e9 \u2014 r\u00e9sum\u00e9 */
+int main(){
+    int a;
+    a = 1 \u00e9;  // \u20ac
+    a = a \u20ac+ 2 \U0001f600;
+    printf("na\u00efve %d", a);
+    return a;
+}
+'''
+
+
+def tokenKey(tok):
+    return tok.type, tok.value, tok.lineno, tok.index, tok.end
+
+
+def binaryTokenKey(tok):
+    # Offsets are in bytes in the binary engine
+    return tok.type, tok.value, tok.lineno
+
+
+def tokensAndErrors(tokens):
+    with contextlib.redirect_stdout(io.StringIO()) as errors:
+        keys = [binaryTokenKey(tok) for tok in tokens]
+    return keys, errors.getvalue()
+
+
+def measure(function, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    argParser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argParser.add_argument('--size', type=float, default=4, help="size of the generated source in MB")
+    argParser.add_argument('--runs', type=int, default=3, help="runs per engine, the best one is reported")
+    args = argParser.parse_args()
+
+    text = generateSource(int(args.size * 1024 * 1024))
+    lexer = CLexer()
+
+    reference = [tokenKey(tok) for tok in lexer.tokenize(text)]
+    if [tokenKey(tok) for tok in lexer.tokenizeFast(text)] != reference:
+        sys.exit("tokenizeFast does not produce the sly token stream")
+    if [tokenKey(tok) for tok in lexer.tokenizeCompact(text)] != reference:
+        sys.exit("tokenizeCompact does not produce the sly token stream")
+    binaryTokens = tokensAndErrors(CLexer().tokenizeFast(NON_ASCII.encode()))
+    if binaryTokens != tokensAndErrors(CLexer().tokenizeFast(NON_ASCII)):
+        sys.exit("tokenizeFast on bytes does not produce the tokens and errors of tokenizeFast on text")
+
+    engines = (
+        ("legacy", lambda: sum(1 for _ in LegacyCLexer().tokenize(text))),
+        ("sly", lambda: sum(1 for _ in lexer.tokenize(text))),
+        ("fast", lambda: sum(1 for _ in lexer.tokenizeFast(text))),
+        ("compact", lambda: len(lexer.tokenizeCompact(text))),
+    )
+    megabytes = len(text) / (1024 * 1024)
+    print("%.1f MB, %d tokens" % (megabytes, len(reference)))
+    print("%-8s %10s %10s" % ("engine", "seconds", "MB/s"))
+    for name, function in engines:
+        elapsed = measure(function, args.runs)
+        print("%-8s %10.3f %10.2f" % (name, elapsed, megabytes / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Measures the time needed to import PFinal with a cold and a warm parse table cache.
+
+Every measurement runs in a fresh interpreter. The cold runs use an empty cache
+directory each time, so sly has to build the LALR automaton of CParser, while the
+warm runs share a directory that already holds the cached tables.
+
+Usage: python benchmarks/startup.py [--runs N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import PFinal; print(time.perf_counter() - t)"
+
+
+def importTime(cacheDir):
+    env = dict(os.environ, PFINAL_CACHE_DIR=cacheDir)
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+def main():
+    argParser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argParser.add_argument('--runs', type=int, default=10, help="number of imports measured per mode")
+    args = argParser.parse_args()
+
+    cold = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as cacheDir:
+            cold.append(importTime(cacheDir))
+
+    warm = []
+    with tempfile.TemporaryDirectory() as cacheDir:
+        importTime(cacheDir)  # Populate the cache
+        for _ in range(args.runs):
+            warm.append(importTime(cacheDir))
+
+    print("%-6s %10s %10s %10s" % ("cache", "median ms", "min ms", "max ms"))
+    for name, times in (("cold", cold), ("warm", warm)):
+        print("%-6s %10.1f %10.1f %10.1f" % (name, statistics.median(times) * 1000, min(times) * 1000,
+                                             max(times) * 1000))
+    print("speedup: %.1fx" % (statistics.median(cold) / statistics.median(warm)))
+
+
+if __name__ == '__main__':
+    main()